@@ -3,11 +3,24 @@ Main entry point of the application.
 """
 
 import os
-from flask import Flask, render_template, request
+from urllib.parse import urlencode
+from flask import Flask, jsonify, make_response, redirect, render_template, request, url_for
 from flask_migrate import Migrate
 from app.resources import api
-from app.models import db, Vendor
-from sqlalchemy import and_
+from app.models import db
+from app.pagination import page_size
+from app.search import SEARCH_ARGS, canonical_search_args, near_filter
+from app.http_cache import http_datetime, make_etag, not_modified, set_validators
+from app.cache import VersionedLRUCache
+from app.engine import engine_options, tune_engine
+from app.profiling import Profiler
+from app.compression import compress_response
+from app.assets import StaticAssets, build_assets
+from app.data_version import DataVersionMonitor, get_data_version
+from app.serving import ServingIndex, serve_city_center, serve_details, serve_facets, serve_search, serving_columns
+from app.snapshot import SnapshotWatcher
+from app.suggest import SUGGEST_LIMIT, SUGGEST_MAX_LIMIT, Suggester
+from sqlalchemy.exc import OperationalError
 import logging
 
 # Configure logging before anything else
@@ -17,23 +30,89 @@ def test_something():
     print('this is a test')
     return 'this is a test'
 
-def create_app():
+def create_app(db_path=None):
     """
     Application factory function to create and configure the Flask app.
+
+    ``db_path`` overrides the SQLite file (tests use a temporary one).
     """
     app = Flask(__name__)
 
     # Set the absolute path for the SQLite database file
     basedir = os.path.abspath(os.path.dirname(__file__))
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(basedir, 'instance', 'vendors.db')}"
+    db_path = db_path or os.path.join(basedir, 'instance', 'vendors.db')
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    app.config["SEARCH_CACHE_SIZE"] = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+    app.config["SEARCH_MAX_AGE"] = int(os.getenv("SEARCH_MAX_AGE", "60"))
+    app.config["DATA_VERSION_POLL_SECONDS"] = float(os.getenv("DATA_VERSION_POLL_SECONDS", "1.0"))
+    app.config["PROFILING"] = os.getenv("PROFILING", "0") == "1"
+    app.config["SLOW_REQUEST_MS"] = float(os.getenv("SLOW_REQUEST_MS", "500"))
+    app.config["COMPRESS_RESPONSES"] = os.getenv("COMPRESS_RESPONSES", "1") == "1"
+    app.config["SERVING_INDEX"] = os.getenv("SERVING_INDEX", "0") == "1"
+    app.config["SERVING_INDEX_REBUILD_SECONDS"] = float(os.getenv("SERVING_INDEX_REBUILD_SECONDS", "5"))
 
     # Initialize extensions
     db.init_app(app)
     api.init_app(app)
+    with app.app_context():
+        tune_engine(db.engine)  # WAL etc., shared with the data pipeline
+        if app.config["PROFILING"]:
+            # Server-Timing headers, slow-request log and /_metrics
+            Profiler(app, db.engine, app.config["SLOW_REQUEST_MS"])
 
     migrate = Migrate(app, db)  # Initialize the Migrate object
 
+    # gzip/brotli for HTML and JSON; hashed, precompressed static files
+    # once `flask build-assets` has been run
+    if app.config["COMPRESS_RESPONSES"]:
+        app.after_request(compress_response)
+    StaticAssets(app)
+
+    @app.cli.command("build-assets")
+    def build_assets_command():
+        """Fingerprint and precompress app/static into static/dist."""
+        built = build_assets(app.static_folder)
+        print(f"Fingerprinted {len(built)} static files.")
+
+    # Snapshot loads (data_processor --snapshot) swap in a new database
+    # file; drop pooled connections so new ones open the new snapshot
+    snapshot_watcher = SnapshotWatcher(db_path, app.config["DATA_VERSION_POLL_SECONDS"])
+
+    @app.before_request
+    def follow_snapshot():
+        if snapshot_watcher.changed():
+            logging.getLogger(__name__).info("Database snapshot swapped: %s", snapshot_watcher.active)
+            db.engine.dispose()
+
+    # Rendered search pages, tagged with the vendors data version
+    search_cache = VersionedLRUCache(app.config["SEARCH_CACHE_SIZE"])
+
+    # Typeahead index, built once here and updated in the background when
+    # the data version changes
+    version_monitor = DataVersionMonitor(
+        lambda: get_data_version(db.session).version,
+        app.config["DATA_VERSION_POLL_SECONDS"],
+    )
+    suggester = Suggester(app, version_monitor)
+    try:
+        with app.app_context():
+            suggester.build(version_monitor.current())
+    except OperationalError:
+        logging.getLogger(__name__).warning("Vendor tables missing; suggestion index starts empty.")
+
+    # Optional in-memory copy of the vendor table that answers reads
+    # (listings, filter/radius searches) without SQLite; see app/serving.py
+    if app.config["SERVING_INDEX"]:
+        serving_index = app.extensions["serving_index"] = ServingIndex(
+            app, version_monitor, app.config["SERVING_INDEX_REBUILD_SECONDS"]
+        )
+        try:
+            serving_index.build()
+        except OperationalError:
+            logging.getLogger(__name__).warning("Vendor tables missing; serving index starts empty.")
+
     # Register models
     # @app.shell_context_processor
     # def make_shell_context():
@@ -67,41 +146,95 @@ def create_app():
     def privacy():
         return render_template("privacy.html")
 
+    @app.route("/suggest")
+    def suggest():
+        q = request.args.get("q", "")
+        limit = page_size(request.args.get("limit"), default=SUGGEST_LIMIT, maximum=SUGGEST_MAX_LIMIT)
+        matches = suggester.suggest(q, limit)
+        return jsonify(q=q, suggestions=[{"label": label, "type": kind} for label, kind in matches])
+
     # this is where the search function is
     @app.route('/search', methods=['GET', 'POST'])
     def search():
+        # Searches are GETs with one canonical query string per search, so
+        # browsers, proxies and CDNs can cache them; old form POSTs redirect
         if request.method == 'POST':
-            # get search terms from the form
-            country = request.form.get('country')
-            service = request.form.get('service')
-            search_term = request.form.get('search')
-            
-            # Combine filters using and_
-            filters = []
-            if country:
-                filters.append(Vendor.country.contains(country))
-            if service:
-                filters.append(Vendor.service_type == service)
-            if search_term: 
-                filters.append(Vendor.name.contains(search_term))
-
-            # Apply combined filters to the query
-            query = Vendor.query.filter(and_(*filters))
-            results = query.all()
-
-            #print(results)
-            if not results:
-                error_message = f"No results found for the search term: {search_term}"
-                return render_template('no_results.html')
-            
-            # Filter out vendors without a website (better approach)
-            #filtered_results = [vendor for vendor in results if vendor.website != 'N/A' or None]
-            # Filter out vendors without a website (better approach)
-            filtered_results = [vendor for vendor in results if vendor.website and vendor.website != 'N/A']
-
-            return render_template('results.html', results=filtered_results)
-        return render_template('index.html')
-    
+            return redirect(url_for('search', **canonical_search_args(request.form)), code=303)
+
+        params = request.args
+        if not any(params.get(k) for k in SEARCH_ARGS + ('cursor',)):
+            return render_template('index.html')
+        args = canonical_search_args(params)
+        # empty form fields (near=, search=) carry no meaning, and the form's
+        # radius only counts with a center: don't redirect for either
+        supplied = [
+            (key, value) for key, value in params.items(multi=True)
+            if value.strip() and (key != "radius_km" or "radius_km" in args)
+        ]
+        if supplied != list(args.items()):
+            return redirect(url_for('search', **args), code=301)
+
+        # Validators come from the data version alone: answer 304 before
+        # running the query or rendering anything
+        columns = serving_columns()
+        version, updated_at = columns.version_info if columns is not None else get_data_version(db.session)
+        cache_key = urlencode(args)
+        etag = make_etag(version, cache_key)
+        last_modified = http_datetime(updated_at)
+        if not_modified(etag, last_modified):
+            return set_validators(
+                app.response_class(status=304), etag, last_modified, app.config["SEARCH_MAX_AGE"]
+            )
+
+        # Repeated searches are served from the cache until the data changes
+        html = search_cache.get(cache_key, version)
+        if html is None:
+            html = render_search(args)
+            search_cache.set(cache_key, version, html)
+        return set_validators(
+            make_response(html), etag, last_modified, app.config["SEARCH_MAX_AGE"]
+        )
+
+    def render_search(args):
+        # get search terms from the canonical query
+        country = args.get('country')
+        service = args.get('service')
+        city = args.get('city')
+        search_term = args.get('search')
+        per_page = page_size(args.get('per_page'))
+        cursor = args.get('cursor')
+        near = near_filter(args, serve_city_center)
+
+        # predicates (including the website check) and paging run in SQL,
+        # or in the serving index when it is enabled and current
+        page = serve_search(country, service, search_term, cursor, per_page, near, city)
+
+        #print(results)
+        if not page.results and not cursor:
+            error_message = f"No results found for the search term: {search_term}"
+            return render_template('no_results.html')
+
+        search_args = {k: v for k, v in args.items() if k != 'cursor'}
+        next_url = None
+        if page.next_cursor:
+            next_url = url_for('search', **search_args, cursor=page.next_cursor)
+
+        # Counts per service type / city, each linking to a narrowed search
+        facets = serve_facets(country, service, search_term, near, city)
+        facet_links = {
+            name: [(value, n, url_for('search', **canonical_search_args({**search_args, arg: value})))
+                   for value, n in counts]
+            for name, arg, counts in (
+                ("service_type", "service", facets["service_type"]),
+                ("city", "city", facets["city"]),
+            )
+        }
+        # opening hours live in a side table: one small query for this page
+        # (none with the serving index)
+        details = serve_details([row.id for row in page.results])
+        return render_template('results.html', results=page.results, next_url=next_url,
+                               facets=facet_links, details=details)
+
     # Custom 404 error handler
     @app.errorhandler(404)
     def page_not_found(e):
@@ -0,0 +1,119 @@
+'''
+Fingerprinted, precompressed static assets
+
+``flask build-assets`` (or ``python -m app.assets``) copies every file in
+app/static to static/dist/ under a content-hashed name, writes .gz / .br
+siblings for text assets and records the mapping in dist/manifest.json.
+When a manifest exists, url_for('static', ...) points at the hashed
+copies, and they are served with a one-year immutable Cache-Control and
+the best precompressed variant the client accepts. Without a build,
+static files are served exactly as before.
+'''
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import send_from_directory
+
+from app.compression import accepted_encodings, brotli
+
+DIST_DIR = "dist"
+MANIFEST_FILE = "manifest.json"
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+PRECOMPRESS_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map"}
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+DEFAULT_STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+
+
+def fingerprinted_name(path, data):
+    '''css/styles.css -> css/styles.<hash>.css
+    '''
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def build_assets(static_dir=DEFAULT_STATIC_DIR):
+    '''(re)build static/dist and return the manifest {source: hashed path}
+    '''
+    dist = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for name in sorted(files):
+            source = os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/")
+            with open(os.path.join(static_dir, source), "rb") as f:
+                data = f.read()
+            target = f"{DIST_DIR}/{fingerprinted_name(source, data)}"
+            target_path = os.path.join(static_dir, target)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with open(target_path, "wb") as f:
+                f.write(data)
+            if os.path.splitext(name)[1].lower() in PRECOMPRESS_EXTENSIONS:
+                with open(target_path + ".gz", "wb") as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target_path + ".br", "wb") as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[source] = target
+    with open(os.path.join(dist, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class StaticAssets:
+    '''rewrites static URLs to fingerprinted copies and serves them
+
+    Takes over the app's ``static`` endpoint; anything not in the manifest
+    falls back to Flask's own static file handling.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+        self.manifest = {}
+        manifest_path = os.path.join(app.static_folder, DIST_DIR, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        self.hashed = set(self.manifest.values())
+        app.url_defaults(self._fingerprint)
+        app.view_functions["static"] = self.send_static
+
+    def _fingerprint(self, endpoint, values):
+        if endpoint == "static" and values.get("filename") in self.manifest:
+            values["filename"] = self.manifest[values["filename"]]
+
+    def send_static(self, filename):
+        if filename not in self.hashed:
+            return self.app.send_static_file(filename)
+
+        # pick the best precompressed sibling the client accepts
+        folder = self.app.static_folder
+        served, encoding = filename, None
+        for name in accepted_encodings():
+            candidate = filename + PRECOMPRESSED_SUFFIXES[name]
+            if os.path.exists(os.path.join(folder, candidate)):
+                served, encoding = candidate, name
+                break
+
+        response = send_from_directory(
+            folder, served, mimetype=mimetypes.guess_type(filename)[0], max_age=IMMUTABLE_MAX_AGE
+        )
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if os.path.splitext(filename)[1].lower() in PRECOMPRESS_EXTENSIONS:
+            response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+if __name__ == "__main__":
+    built = build_assets()
+    print(f"Fingerprinted {len(built)} static files into {os.path.join(DEFAULT_STATIC_DIR, DIST_DIR)}.")
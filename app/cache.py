@@ -0,0 +1,62 @@
+'''
+Bounded LRU cache tagged with the vendors data version
+'''
+
+import threading
+from collections import OrderedDict
+
+
+class VersionedLRUCache:
+    '''LRU cache whose entries are only valid for one data version
+
+    When a lookup or store sees a newer version than the cache was filled
+    under, every entry is dropped: no TTL guessing, no stale pages.
+    '''
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sync_version(self, version):
+        '''adopt a newer version; False if the caller's version is stale
+        '''
+        if self.version is None or version > self.version:
+            self._entries.clear()
+            self.version = version
+        return version == self.version
+
+    def get(self, key, version):
+        with self._lock:
+            if not self._sync_version(version):
+                self.misses += 1
+                return None
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, version, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if not self._sync_version(version):
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
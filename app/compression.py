@@ -0,0 +1,68 @@
+'''
+gzip / brotli content negotiation for dynamic responses
+
+brotli is optional: without the package, clients that accept gzip still
+get gzip.
+'''
+
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+# Below this, compression costs more than the bytes it saves
+MIN_COMPRESS_SIZE = 500
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # fast enough per request; static assets use 11
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html", "text/css", "text/plain", "text/csv", "text/javascript",
+    "application/json", "application/x-ndjson", "application/javascript",
+    "application/xml", "image/svg+xml",
+}
+
+
+def accepted_encodings():
+    '''encodings this server can produce, best first, that the client accepts
+    '''
+    offered = (["br"] if brotli is not None else []) + ["gzip"]
+    accept = request.accept_encodings
+    return [name for name in offered if accept.quality(name) > 0]
+
+
+def compress(data, encoding, level=None):
+    '''``data`` compressed with "br" or "gzip"
+    '''
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+
+
+def compress_response(response):
+    '''after_request hook: compress eligible bodies for clients that accept it
+
+    Streamed responses (exports, ?stream=1) and pre-encoded files pass
+    through untouched. A strong ETag becomes weak, since the encoded bytes
+    differ from the identity representation it was computed for.
+    '''
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encodings = accepted_encodings()
+    data = response.get_data()
+    if not encodings or len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(compress(data, encodings[0]))
+    response.headers["Content-Encoding"] = encodings[0]
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,39 @@
+'''
+Country name -> ISO 3166-1 alpha-2 code normalization
+'''
+
+# Names as they show up in pipeline records and the search form
+COUNTRY_CODES = {
+    "united states": "US",
+    "united states of america": "US",
+    "usa": "US",
+    "canada": "CA",
+    "france": "FR",
+    "germany": "DE",
+    "deutschland": "DE",
+    "italy": "IT",
+    "italia": "IT",
+    "spain": "ES",
+    "españa": "ES",
+    "espana": "ES",
+    "türkiye": "TR",
+    "turkiye": "TR",
+    "turkey": "TR",
+    "united kingdom": "GB",
+    "portugal": "PT",
+    "greece": "GR",
+    "malta": "MT",
+}
+
+
+def country_code(value):
+    '''return the ISO alpha-2 code for a country name or code, or None
+
+    Two-letter input is taken to already be a code.
+    '''
+    if not value:
+        return None
+    value = value.strip()
+    if len(value) == 2 and value.isalpha():
+        return value.upper()
+    return COUNTRY_CODES.get(value.lower())
@@ -0,0 +1,73 @@
+'''
+Data version of the vendors table
+
+Every writer (REST resources, data pipeline) bumps the version in the same
+transaction as its changes; caches tag their entries with it so stale
+entries drop out as soon as the data changes.
+'''
+
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import func, insert, select, update
+
+from app.models import DataVersion, utcnow
+
+VersionInfo = namedtuple("VersionInfo", ["version", "updated_at"])
+
+_ROW_ID = 1
+
+
+def get_data_version(connection):
+    '''current (version, updated_at); version 0 before the first write
+
+    ``connection`` can be a Connection or a Session.
+    '''
+    row = connection.execute(
+        select(DataVersion.version, DataVersion.updated_at).where(DataVersion.id == _ROW_ID)
+    ).first()
+    if row is None:
+        return VersionInfo(0, None)
+    return VersionInfo(row.version, row.updated_at)
+
+
+def bump_data_version(connection, past=0):
+    '''increment the version inside the caller's transaction
+
+    The new version is also greater than ``past``; a snapshot swapped in
+    for a live database passes the live version so caches never see the
+    version go backwards.
+    '''
+    now = utcnow()
+    result = connection.execute(
+        update(DataVersion)
+        .where(DataVersion.id == _ROW_ID)
+        .values(version=func.max(DataVersion.version, past) + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(DataVersion).values(id=_ROW_ID, version=past + 1, updated_at=now))
+
+
+class DataVersionMonitor:
+    '''cached view of the data version for hot paths that must not hit SQLite
+
+    ``read`` returns the current version number; it is called at most once
+    per ``poll_interval`` seconds, all other calls answer from memory.
+    '''
+
+    def __init__(self, read, poll_interval=1.0):
+        self.read = read
+        self.poll_interval = poll_interval
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if self.version is None or now - self._checked_at >= self.poll_interval:
+            with self._lock:
+                if self.version is None or now - self._checked_at >= self.poll_interval:
+                    self.version = self.read()
+                    self._checked_at = now
+        return self.version
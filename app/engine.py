@@ -0,0 +1,95 @@
+'''
+Shared SQLite engine tuning for the web app and the data pipeline
+
+WAL lets /search keep reading while a pipeline load writes; the other
+pragmas trade a little durability on power loss (synchronous=NORMAL is
+still crash-safe under WAL) for far fewer fsyncs and more caching.
+'''
+
+import os
+import sqlite3
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+from app.snapshot import resolve_database
+
+# Negative cache_size is in KiB (default: 64 MiB per connection)
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# How long a writer waits for the lock before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Readers never block each other under WAL, so a modest pool covers the
+# threaded dev server as well as a gunicorn worker's threads
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -SQLITE_CACHE_SIZE_KB),
+    ("mmap_size", SQLITE_MMAP_SIZE),
+    ("busy_timeout", SQLITE_BUSY_TIMEOUT_MS),
+    ("temp_store", "MEMORY"),
+)
+
+
+def _in_memory(url):
+    database = make_url(url).database
+    return not database or database == ":memory:" or database.startswith("file::memory:")
+
+
+def engine_options(url):
+    '''create_engine() keyword arguments for ``url`` (pool sizing, lock timeout)
+
+    Also suitable as SQLALCHEMY_ENGINE_OPTIONS. In-memory databases keep
+    SQLAlchemy's default single-connection pool.
+    '''
+    if _in_memory(url):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    }
+
+
+def apply_pragmas(dbapi_connection, connection_record=None):
+    '''set SQLITE_PRAGMAS on a raw sqlite3 connection
+    '''
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def tune_engine(engine):
+    '''apply the pragmas to every new connection of ``engine``
+
+    New connections also follow snapshot swaps (see app/snapshot.py).
+    Call before the engine hands out its first connection.
+    '''
+    if engine.dialect.name != "sqlite":
+        return engine
+    event.listen(engine, "connect", apply_pragmas)
+
+    database = engine.url.database
+
+    @event.listens_for(engine, "do_connect")
+    def _open_active_snapshot(dialect, connection_record, cargs, cparams):
+        # cargs is shared by every connect: always resolve from the base path
+        if cargs and database:
+            cargs[0] = resolve_database(database)
+
+    return engine
+
+
+def create_tuned_engine(url, **overrides):
+    '''create_engine() with the shared pool options and pragmas
+    '''
+    return tune_engine(create_engine(url, **{**engine_options(url), **overrides}))
@@ -0,0 +1,116 @@
+'''
+Streaming vendor table export (NDJSON / CSV, optionally gzipped)
+
+Rows are read in fetchmany() batches and encoded batch by batch, so an
+export runs in constant memory however large the table is. Used by
+GET /vendors/export and from the command line:
+
+    python -m app.export --format csv --gzip -o vendors.csv.gz
+'''
+
+import argparse
+import csv
+import io
+import os
+import sys
+import zlib
+
+from sqlalchemy import select
+
+from app.engine import create_tuned_engine
+from app.models import VENDOR_FIELDS, Vendor
+from app.serialize import dumps
+
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_BATCH_SIZE = 1000
+
+MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "instance", "vendors.db")
+
+
+def fetch_batches(result, batch_size=EXPORT_BATCH_SIZE):
+    '''yield lists of rows from a DB-API cursor or SQLAlchemy result
+    '''
+    while True:
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def ndjson_chunks(header, batches):
+    '''one JSON object per line, one text chunk per batch
+    '''
+    for rows in batches:
+        yield "".join(dumps(dict(zip(header, row))) + "\n" for row in rows)
+
+
+def csv_chunks(header, batches):
+    '''RFC 4180 CSV (quoted as needed, NULL as empty), header row first
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_chunks(fmt, header, batches):
+    '''text chunks of an export in ``fmt``
+    '''
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return (ndjson_chunks if fmt == "ndjson" else csv_chunks)(header, batches)
+
+
+def gzip_chunks(chunks):
+    '''gzip a stream of text chunks incrementally
+    '''
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_vendors(connection, fmt, fields=VENDOR_FIELDS, gzip=False, batch_size=EXPORT_BATCH_SIZE):
+    '''stream the vendor table as encoded chunks (bytes if ``gzip``, else str)
+    '''
+    query = select(*[Vendor.__table__.c[field] for field in fields]).order_by(Vendor.id)
+    result = connection.execution_options(stream_results=True).execute(query)
+    chunks = encode_chunks(fmt, fields, fetch_batches(result, batch_size))
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the vendors table.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite database path")
+    args = parser.parse_args(argv)
+
+    engine = create_tuned_engine(f"sqlite:///{os.path.abspath(args.db)}")
+    if args.output:
+        out = open(args.output, "wb") if args.gzip else open(args.output, "w", newline="")
+    else:
+        out = sys.stdout.buffer if args.gzip else sys.stdout
+    try:
+        with engine.connect() as connection:
+            for chunk in export_vendors(connection, args.format, gzip=args.gzip):
+                out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+'''
+Geo radius search: SQLite R*Tree index over vendor coordinates
+'''
+
+import math
+from collections import namedtuple
+
+from sqlalchemy import column, func, table, text
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_RADIUS_KM = 25.0
+MAX_RADIUS_KM = 500.0
+
+RTREE_TABLE = "vendors_rtree"
+
+CREATE_RTREE_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(
+    id, min_lat, max_lat, min_lon, max_lon
+)
+"""
+
+# Same approach as the FTS index: triggers keep the R*Tree in step with
+# every write to ``vendors``. Vendors without coordinates are not indexed.
+CREATE_RTREE_TRIGGERS = (
+    f"""
+CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ai AFTER INSERT ON vendors
+WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+    INSERT INTO {RTREE_TABLE}(id, min_lat, max_lat, min_lon, max_lon)
+    VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+END
+""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ad AFTER DELETE ON vendors BEGIN
+    DELETE FROM {RTREE_TABLE} WHERE id = old.id;
+END
+""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_au AFTER UPDATE OF lat, lon ON vendors BEGIN
+    DELETE FROM {RTREE_TABLE} WHERE id = old.id;
+    INSERT INTO {RTREE_TABLE}(id, min_lat, max_lat, min_lon, max_lon)
+    SELECT new.id, new.lat, new.lat, new.lon, new.lon
+    WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+END
+""",
+)
+
+DROP_RTREE = (
+    f"DROP TRIGGER IF EXISTS {RTREE_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {RTREE_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {RTREE_TABLE}_au",
+    f"DROP TABLE IF EXISTS {RTREE_TABLE}",
+)
+
+rtree = table(RTREE_TABLE, column("id"), column("min_lat"), column("max_lat"),
+              column("min_lon"), column("max_lon"))
+
+# Center point and radius of a "within N km" search
+GeoFilter = namedtuple("GeoFilter", ["lat", "lon", "radius_km"])
+
+
+def install_geo_index(connection):
+    '''create the R*Tree table and sync triggers (idempotent)
+    '''
+    connection.execute(text(CREATE_RTREE_TABLE))
+    for ddl in CREATE_RTREE_TRIGGERS:
+        connection.execute(text(ddl))
+
+
+def rebuild_geo_index(connection):
+    '''repopulate the R*Tree from vendor coordinates
+    '''
+    connection.execute(text(f"DELETE FROM {RTREE_TABLE}"))
+    connection.execute(text(
+        f"INSERT INTO {RTREE_TABLE}(id, min_lat, max_lat, min_lon, max_lon) "
+        "SELECT id, lat, lat, lon, lon FROM vendors WHERE lat IS NOT NULL AND lon IS NOT NULL"
+    ))
+
+
+def ensure_geo_index(engine):
+    '''install the R*Tree on an existing database and backfill it if it was missing
+    '''
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": RTREE_TABLE},
+        ).first()
+        install_geo_index(connection)
+        if not exists:
+            rebuild_geo_index(connection)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    '''great-circle distance in kilometres; None if any coordinate is missing
+    '''
+    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
+        return None
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def register_sql_functions(dbapi_connection):
+    '''expose haversine_km() to SQL on a raw sqlite3 connection
+    '''
+    dbapi_connection.create_function("haversine_km", 4, haversine_km, deterministic=True)
+
+
+def bounding_box(lat, lon, radius_km):
+    '''(south, west, north, east) box that contains the search circle
+    '''
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # Longitude degrees shrink towards the poles; clamp to avoid blow-up
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * max(0.01, math.cos(math.radians(lat)))))
+    return (
+        max(-90.0, lat - dlat),
+        max(-180.0, lon - dlon),
+        min(90.0, lat + dlat),
+        min(180.0, lon + dlon),
+    )
+
+
+def radius(value):
+    '''parse a requested radius, clamped to (0, MAX_RADIUS_KM]
+    '''
+    try:
+        km = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RADIUS_KM
+    if not math.isfinite(km) or km <= 0:
+        return DEFAULT_RADIUS_KM
+    return min(km, MAX_RADIUS_KM)
+
+
+def coordinate(value, limit):
+    '''parse a latitude (limit=90) or longitude (limit=180); None if invalid
+    '''
+    try:
+        deg = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(deg) or abs(deg) > limit:
+        return None
+    return deg
+
+
+def bbox_filter(geo):
+    '''R*Tree prefilter for a query joined to ``rtree``
+    '''
+    south, west, north, east = bounding_box(geo.lat, geo.lon, geo.radius_km)
+    return (
+        (rtree.c.max_lat >= south)
+        & (rtree.c.min_lat <= north)
+        & (rtree.c.max_lon >= west)
+        & (rtree.c.min_lon <= east)
+    )
+
+
+def distance_km(lat_column, lon_column, geo):
+    '''SQL expression for the exact distance from the search center
+    '''
+    return func.haversine_km(lat_column, lon_column, geo.lat, geo.lon)
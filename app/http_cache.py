@@ -0,0 +1,51 @@
+'''
+HTTP conditional request helpers (ETag / Last-Modified)
+'''
+
+import hashlib
+from datetime import timezone
+
+from flask import request
+
+
+def make_etag(*parts):
+    '''short, stable validator derived from the given parts
+    '''
+    raw = "\x1f".join(str(p) for p in parts).encode()
+    return hashlib.sha1(raw).hexdigest()[:20]
+
+
+def http_datetime(value):
+    '''naive-UTC datetime from the database -> aware, whole-second datetime
+    '''
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def not_modified(etag, last_modified=None):
+    '''True if the client's cached copy is still valid
+
+    If-None-Match wins over If-Modified-Since and uses weak comparison, as
+    RFC 9110 requires (compressed responses carry a weak ETag).
+    '''
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return bool(since and last_modified and last_modified <= since)
+
+
+def set_validators(response, etag, last_modified=None, max_age=0):
+    '''attach ETag, Last-Modified and a shared-cache policy to a response
+
+    The ETag is always weak and the response varies on Accept-Encoding:
+    the 200 may leave compressed (see app/compression.py) while a 304 never
+    is, and both must hand a cache the same validator.
+    '''
+    response.set_etag(etag, weak=True)
+    response.vary.add("Accept-Encoding")
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
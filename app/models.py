@@ -2,57 +2,260 @@
 Database
 '''
 
+import sqlite3
+from datetime import datetime, timezone
+
 from flask_sqlalchemy import SQLAlchemy
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import Session, attribute_keyed_dict
+
+from app.countries import country_code
+from app.geo import install_geo_index, register_sql_functions
+from app.normalize import EMPTY_VALUES, normalize_text, parse_hours
+from app.search_index import install_search_index
 
 db = SQLAlchemy()  # SQLAlchemy instance to handle the database
 
+
+def utcnow():
+    '''naive UTC timestamp, as stored in SQLite DateTime columns
+    '''
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Public columns of the core vendors row, in API output order (listings,
+# search, exports); these never touch the side tables
+VENDOR_FIELDS = (
+    "id", "name", "service_type", "price_range", "address", "country", "country_code",
+    "city", "lat", "lon", "contact", "picture_url", "website",
+)
+
+# Side-table fields, added by to_dict() and GET /vendor/<id>
+VENDOR_DETAIL_FIELDS = ("hours", "links")
+
+# vendor_links.kind values (formerly one nullable column each)
+SOCIAL_LINK_KINDS = ("instagram", "facebook", "twitter", "linkedin", "youtube", "tiktok", "pinterest")
+
 class Vendor(db.Model):
     __tablename__ = "vendors"
+    __table_args__ = (
+        # composite indexes for the common /search filter combinations
+        db.Index("ix_vendors_country_code_service_type", "country_code", "service_type"),
+        db.Index("ix_vendors_country_code_city", "country_code", "city"),
+        # "near <city>" lookups compare case-insensitively
+        db.Index("ix_vendors_city_nocase", db.text("city COLLATE NOCASE")),
+        db.Index("ix_vendors_name_norm", "name_norm"),
+        # covers conditional GETs: the validators are read without touching the row
+        db.Index("ix_vendors_id_row_version", "id", "row_version", "updated_at"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
+    name_norm = db.Column(db.String(100), nullable=True)  # normalize_text(name), for accent-insensitive search
     country = db.Column(db.String(100), nullable=True) # added country
+    country_code = db.Column(db.String(2), nullable=True)  # ISO 3166-1 alpha-2, derived from country
     service_type = db.Column(db.String(50), nullable=False)
     price_range = db.Column(db.String(50), nullable=True)
     address = db.Column(db.String(200), nullable=True)  # Physical address
     city = db.Column(db.String(50), nullable=True)  # City or location
+    lat = db.Column(db.Float, nullable=True)  # Latitude (WGS84)
+    lon = db.Column(db.Float, nullable=True)  # Longitude (WGS84)
     contact = db.Column(db.String(100), nullable=True)  # Email/phone/social media
-    hours = db.Column(db.String(100), nullable=True)  # Operating hours
     picture_url = db.Column(db.String(200), nullable=True)  # URL or path to the picture
     website = db.Column(db.String(200), nullable=True)  # Website URL
-    instagram = db.Column(db.String(200), nullable=True)  # Instagram URL
-    facebook = db.Column(db.String(200), nullable=True)  # Facebook URL
-    twitter = db.Column(db.String(200), nullable=True)  # Twitter URL
-    linkedin = db.Column(db.String(200), nullable=True)  # LinkedIn URL
-    youtube = db.Column(db.String(200), nullable=True)  # YouTube URL
-    tiktok = db.Column(db.String(200), nullable=True)  # TikTok URL
-    pinterest = db.Column(db.String(200), nullable=True)  # Pinterest URL
+    # Bumped on every UPDATE issued through SQLAlchemy (ORM, Core or bulk)
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default=db.text("1"),
+                            onupdate=db.literal_column("row_version") + 1)
+    updated_at = db.Column(db.DateTime, nullable=True, default=utcnow, onupdate=utcnow)
+
+    # Rarely-set and bulky data lives in side tables, loaded only on demand
+    hours_entries = db.relationship("VendorHours", order_by="VendorHours.position",
+                                    cascade="all, delete-orphan", back_populates="vendor")
+    links = db.relationship("VendorLink", collection_class=attribute_keyed_dict("kind"),
+                            cascade="all, delete-orphan", back_populates="vendor")
+    sources = db.relationship("VendorSource", cascade="all, delete-orphan", back_populates="vendor")
+    # vendor.link_urls["instagram"] = url
+    link_urls = association_proxy("links", "url", creator=lambda kind, url: VendorLink(kind=kind, url=url))
 
     def __repr__(self):
         '''return string representation of the object
         '''
         return f"<Vendor {self.name}>"
 
+    @property
+    def hours(self):
+        '''opening hours as a list of lines
+        '''
+        return [entry.text for entry in self.hours_entries]
+
+    @hours.setter
+    def hours(self, value):
+        # accepts a list, a stringified list or an OSM opening_hours string;
+        # rows are rewritten in place (new rows would collide on position
+        # with the old ones, which the flush deletes only afterwards)
+        lines = parse_hours(value)
+        entries = self.hours_entries
+        for position, line in enumerate(lines):
+            if position < len(entries):
+                entries[position].text = line
+            else:
+                entries.append(VendorHours(position=position, text=line))
+        del entries[len(lines):]
+
     def to_dict(self):
         '''return attributes ad dictionary
         '''
-        return {
-            "id": self.id,
-            "name": self.name,
-            "service_type": self.service_type,
-            "price_range": self.price_range,
-            "address": self.address,
-            "country": self.country,
-            "city": self.city,
-            "contact": self.contact,
-            "hours": self.hours,
-            "picture_url": self.picture_url,
-            "website": self.website,
-            "instagram": self.instagram,
-            "facebook": self.facebook,
-            "twitter": self.twitter,
-            "linkedin": self.linkedin,
-            "youtube": self.youtube,
-            "tiktok": self.tiktok,
-            "pinterest": self.pinterest
-        }
\ No newline at end of file
+        data = {field: getattr(self, field) for field in VENDOR_FIELDS}
+        data["hours"] = self.hours
+        data["links"] = dict(self.link_urls)
+        return data
+
+
+class VendorLink(db.Model):
+    '''social profile URL of a vendor, one row per kind
+    '''
+    __tablename__ = "vendor_links"
+    __table_args__ = (db.UniqueConstraint("vendor_id", "kind", name="uq_vendor_links_vendor_id_kind"),)
+    id = db.Column(db.Integer, primary_key=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey("vendors.id", ondelete="CASCADE"), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # one of SOCIAL_LINK_KINDS
+    url = db.Column(db.String(200), nullable=False)
+    vendor = db.relationship("Vendor", back_populates="links")
+
+
+class VendorHours(db.Model):
+    '''one line of a vendor's opening hours ("Mon: 9:00-17:00")
+    '''
+    __tablename__ = "vendor_hours"
+    __table_args__ = (db.UniqueConstraint("vendor_id", "position", name="uq_vendor_hours_vendor_id_position"),)
+    id = db.Column(db.Integer, primary_key=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey("vendors.id", ondelete="CASCADE"), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.String(100), nullable=False)
+    vendor = db.relationship("Vendor", back_populates="hours_entries")
+
+
+class VendorSource(db.Model):
+    '''where a vendor record came from (OSM, Yelp, Foursquare, ...)
+    '''
+    __tablename__ = "vendor_sources"
+    __table_args__ = (
+        # reloads resolve records to existing vendors through this index
+        db.Index("ix_vendor_sources_source_source_id", "source", "source_id", unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey("vendors.id", ondelete="CASCADE"), nullable=False, index=True)
+    source = db.Column(db.String(30), nullable=False)  # lowercased: "osm", "yelp", "foursquare"
+    source_id = db.Column(db.String(100), nullable=True)  # id within the source, e.g. "node/123"
+    vendor = db.relationship("Vendor", back_populates="sources")
+
+
+class DataVersion(db.Model):
+    '''single-row counter bumped on every write to the vendors table
+    '''
+    __tablename__ = "data_version"
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<DataVersion {self.version}>"
+
+
+@event.listens_for(Vendor.__table__, "after_create")
+def _create_search_index(target, connection, **kw):
+    '''install the FTS and R*Tree indexes whenever create_all() builds the vendors table
+    '''
+    install_search_index(connection)
+    install_geo_index(connection)
+
+
+@event.listens_for(Engine, "connect")
+def _register_sql_functions(dbapi_connection, connection_record):
+    '''make haversine_km() available to queries on every SQLite connection
+    '''
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        register_sql_functions(dbapi_connection)
+
+
+def clean_links(values):
+    '''{kind: url} for the social links in a pipeline record, placeholders dropped
+    '''
+    links = {}
+    for kind in SOCIAL_LINK_KINDS:
+        url = (values.get(kind) or "").strip()
+        if url.lower() not in EMPTY_VALUES:
+            links[kind] = url
+    return links
+
+
+def vendor_details(ids):
+    '''{vendor_id: {"hours": [...], "links": {...}}} for a page of vendors
+
+    Two small IN queries on the side tables, so listings can stay on the
+    core row and add details only for what they display.
+    '''
+    details = {vendor_id: {"hours": [], "links": {}} for vendor_id in ids}
+    if not details:
+        return details
+    hours = db.session.execute(
+        select(VendorHours.vendor_id, VendorHours.text)
+        .where(VendorHours.vendor_id.in_(details))
+        .order_by(VendorHours.vendor_id, VendorHours.position)
+    )
+    for vendor_id, text in hours:
+        details[vendor_id]["hours"].append(text)
+    links = db.session.execute(
+        select(VendorLink.vendor_id, VendorLink.kind, VendorLink.url).where(VendorLink.vendor_id.in_(details))
+    )
+    for vendor_id, kind, url in links:
+        details[vendor_id]["links"][kind] = url
+    return details
+
+
+def derived_columns(values):
+    '''name_norm / country_code for a dict of vendor column values
+
+    Core inserts and updates bypass the ORM hook below, so bulk writers
+    merge this into their rows. Only columns whose source is present are
+    returned, which keeps partial updates partial.
+    '''
+    derived = {}
+    if "name" in values:
+        derived["name_norm"] = normalize_text(values["name"])
+    if "country" in values:
+        derived["country_code"] = country_code(values["country"])
+    return derived
+
+
+@event.listens_for(Vendor, "before_insert")
+@event.listens_for(Vendor, "before_update")
+def _fill_derived_columns(mapper, connection, target):
+    '''keep country_code and name_norm in step with country and name for ORM writes
+    '''
+    for key, value in derived_columns({"name": target.name, "country": target.country}).items():
+        setattr(target, key, value)
+
+
+@event.listens_for(Session, "before_flush")
+def _touch_vendors_with_changed_details(session, flush_context, instances):
+    '''bump row_version / updated_at when a vendor's side-table rows change
+
+    Keeps the conditional GET validators of /vendor/<id> honest for edits
+    that never touch the core row.
+    '''
+    touched = set()
+    with session.no_autoflush:
+        dirty = [obj for obj in session.dirty if session.is_modified(obj)]
+        for obj in list(session.new) + dirty + list(session.deleted):
+            if isinstance(obj, (VendorHours, VendorLink, VendorSource)) and obj.vendor is not None:
+                touched.add(obj.vendor)
+            elif isinstance(obj, Vendor) and obj in dirty:
+                state = inspect(obj)
+                if any(state.attrs[name].history.has_changes() for name in ("hours_entries", "links", "sources")):
+                    touched.add(obj)
+    for vendor in touched:
+        if inspect(vendor).persistent and vendor not in session.deleted:
+            vendor.updated_at = utcnow()
@@ -0,0 +1,75 @@
+'''
+Text normalization shared by the pipeline and the web search
+'''
+
+import ast
+import unicodedata
+from typing import List, Optional
+
+# Placeholder values the scrapers store for "unknown"
+EMPTY_VALUES = {"", "n/a", "none", "null", "[]"}
+
+
+def normalize_text(s: Optional[str]) -> str:
+    """
+    Normalize a string for comparison: lowercase, strip, remove diacritics and punctuation,
+    and drop common company suffixes.
+    """
+    if not s:
+        return ""
+    s = s.strip().lower()
+
+    # Remove accents
+    s = "".join(
+        c for c in unicodedata.normalize("NFD", s)
+        if unicodedata.category(c) != "Mn"
+    )
+
+    # Replace punctuation with spaces
+    punct = r"""!"#$%&'()*+,-./:;<=>?@[\]^_`{|}~"""
+    s = s.translate(str.maketrans({c: " " for c in punct}))
+
+    # Collapse whitespace
+    s = " ".join(s.split())
+
+    # Remove common company tokens
+    tokens = s.split()
+    drop = {
+        "srl", "s.r.l.", "spa", "s.p.a.", "sas", "snc", "ltd", "co", "inc",
+        "di", "del", "della", "dei", "degli", "studio", "the"
+    }
+    tokens = [t for t in tokens if t not in drop]
+    return " ".join(tokens)
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """
+    A string that sorts after every string starting with ``prefix``, so a
+    prefix match can be written as an indexable range:
+    prefix <= col < prefix_upper_bound(prefix).
+    """
+    return prefix + "\U0010ffff"
+
+
+def parse_hours(value) -> List[str]:
+    """
+    Opening hours as a list of lines, from any of the stored shapes: a list,
+    a stringified Python list (the Google scripts), or a ";"-separated OSM
+    opening_hours string. Placeholders like "N/A" give an empty list.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        text = value.strip()
+        if text.lower() in EMPTY_VALUES:
+            return []
+        if text.startswith("["):
+            try:
+                value = ast.literal_eval(text)
+            except (ValueError, SyntaxError):
+                value = [text]
+        else:
+            value = text.split(";")
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [str(line).strip() for line in value if str(line).strip()]
@@ -0,0 +1,53 @@
+'''
+Keyset (cursor) pagination helpers
+'''
+
+import base64
+import json
+import math
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    '''parse a requested page size, clamped to [1, maximum]
+    '''
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def encode_cursor(*key):
+    '''opaque, url-safe token for the sort key of the last row on a page
+    '''
+    raw = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, types):
+    '''decode a cursor token into a tuple of values converted by ``types``
+
+    ``types`` holds one converter per key column, e.g. (float, int) for a
+    (rank, id) key. Returns None for a missing or malformed token, or one
+    whose values don't convert to finite numbers, so a tampered link just
+    falls back to the first page.
+    '''
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(key, list) or len(key) != len(types):
+        return None
+    try:
+        key = tuple(convert(value) for convert, value in zip(types, key))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if not all(math.isfinite(value) for value in key):
+        return None
+    return key
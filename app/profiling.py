@@ -0,0 +1,136 @@
+'''
+Opt-in per-request profiling: wall time, SQL statements and template time
+
+Enabled with PROFILING=1. Each response gets a Server-Timing header,
+requests slower than SLOW_REQUEST_MS are logged, and /_metrics returns
+per-route aggregates as JSON.
+'''
+
+import logging
+import threading
+import time
+
+from flask import before_render_template, g, has_request_context, jsonify, request, template_rendered
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+class RouteStats:
+    '''running totals for one route
+    '''
+
+    def __init__(self):
+        self.requests = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+
+    def add(self, total_ms, sql_count, sql_ms, template_ms):
+        self.requests += 1
+        self.total_ms += total_ms
+        self.max_ms = max(self.max_ms, total_ms)
+        self.sql_count += sql_count
+        self.sql_ms += sql_ms
+        self.template_ms += template_ms
+
+    def to_dict(self):
+        n = self.requests or 1
+        return {
+            "requests": self.requests,
+            "avg_ms": round(self.total_ms / n, 3),
+            "max_ms": round(self.max_ms, 3),
+            "avg_sql_count": round(self.sql_count / n, 2),
+            "avg_sql_ms": round(self.sql_ms / n, 3),
+            "avg_template_ms": round(self.template_ms / n, 3),
+        }
+
+
+class Profiler:
+    '''request/SQL/template timing for one app and its engine
+
+    Counters for the current request live on ``g``; engine and template
+    events outside a request (startup, background rebuilds) are ignored.
+    '''
+
+    def __init__(self, app, engine, slow_ms=500.0):
+        self.slow_ms = slow_ms
+        self.routes = {}
+        self._lock = threading.Lock()
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.add_url_rule("/_metrics", "metrics", self.metrics)
+
+    @staticmethod
+    def _current():
+        if has_request_context():
+            return g.get("_profile")
+        return None
+
+    def _start(self):
+        g._profile = {"start": time.perf_counter(), "sql_count": 0, "sql_ms": 0.0,
+                      "template_ms": 0.0, "template_start": None}
+
+    # The start time lives on the statement's execution context, which is
+    # dropped with the statement: one that raises leaves nothing behind on
+    # the pooled connection for a later statement to pair with.
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None and self._current() is not None:
+            context._profile_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = self._current()
+        started = getattr(context, "_profile_start", None)
+        if profile is not None and started is not None:
+            profile["sql_count"] += 1
+            profile["sql_ms"] += (time.perf_counter() - started) * 1000
+
+    def _before_render(self, sender, template, context, **extra):
+        profile = self._current()
+        if profile is not None:
+            profile["template_start"] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        profile = self._current()
+        if profile is not None and profile["template_start"] is not None:
+            profile["template_ms"] += (time.perf_counter() - profile["template_start"]) * 1000
+            profile["template_start"] = None
+
+    def _finish(self, response):
+        profile = g.pop("_profile", None)
+        if profile is None:
+            return response
+        total_ms = (time.perf_counter() - profile["start"]) * 1000
+        sql_count, sql_ms, template_ms = profile["sql_count"], profile["sql_ms"], profile["template_ms"]
+
+        response.headers.add(
+            "Server-Timing",
+            f'app;dur={total_ms:.2f}, db;dur={sql_ms:.2f};desc="{sql_count} queries", '
+            f"tpl;dur={template_ms:.2f}",
+        )
+        if total_ms >= self.slow_ms:
+            logger.warning(
+                "Slow request: %s %s -> %s in %.1f ms (%d queries, %.1f ms SQL, %.1f ms templates)",
+                request.method, request.full_path.rstrip("?"), response.status_code,
+                total_ms, sql_count, sql_ms, template_ms,
+            )
+
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+        with self._lock:
+            self.routes.setdefault(route, RouteStats()).add(total_ms, sql_count, sql_ms, template_ms)
+        return response
+
+    def metrics(self):
+        '''aggregated timings per route, slowest average first
+        '''
+        with self._lock:
+            routes = [{"route": route, **stats.to_dict()} for route, stats in self.routes.items()]
+        routes.sort(key=lambda item: -item["avg_ms"])
+        return jsonify(slow_request_ms=self.slow_ms, routes=routes)
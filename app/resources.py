@@ -2,37 +2,270 @@
 CRUD API Endpoints
 '''
 
-from flask_restful import Resource, Api, reqparse
-from app.models import Vendor, db
+import json
+from functools import lru_cache
+
+from flask import Response, request, stream_with_context, url_for
+from flask_restful import Resource, Api, abort, reqparse
+from sqlalchemy import insert, select, text, update
+from app.models import VENDOR_DETAIL_FIELDS, VENDOR_FIELDS, Vendor, db, derived_columns, vendor_details
+from app.data_version import bump_data_version
+from app.export import EXPORT_FORMATS, MIMETYPES, export_vendors
+from app.http_cache import http_datetime, make_etag, not_modified, set_validators
+from app.pagination import page_size
+from app.search import RESULT_KEYS, near_filter
+from app.serialize import dumps, output_json, rows_to_dicts, statement_keys
+from app.serving import serve_city_center, serve_facets, serve_search, serving_columns
 
 # Initialize the API object here
 api = Api()
+api.representation("application/json")(output_json)
+
+# GET /vendors page size (use ?stream=1 to dump the whole table)
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 1000
+
+# Rows fetched per round trip when streaming
+STREAM_BATCH_SIZE = 500
+
+
+def requested_fields(available=VENDOR_FIELDS):
+    '''fields named in ?fields=a,b,c (id is always included); all ``available`` by default
+    '''
+    raw = request.args.get("fields")
+    if not raw:
+        return available
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = sorted(set(names) - set(available))
+    if unknown:
+        abort(400, message=f"Unknown field(s): {', '.join(unknown)}")
+    # keep the canonical field order and drop duplicates
+    wanted = set(names) | {"id"}
+    return tuple(field for field in available if field in wanted)
+
+
+def vendor_columns(fields):
+    '''table columns for a list of public field names
+    '''
+    return [Vendor.__table__.c[field] for field in fields]
+
+
+@lru_cache(maxsize=64)
+def vendor_listing(fields):
+    '''(select, keys) over the vendors table for a tuple of field names
+
+    Built once per field set, so list requests only add their WHERE/LIMIT.
+    '''
+    query = select(*vendor_columns(fields)).order_by(Vendor.id)
+    return query, statement_keys(query)
+
+
+def stream_vendors(after_id=0, fields=VENDOR_FIELDS):
+    '''stream the vendor table as one JSON array, a batch of rows at a time
+
+    Rows come from a server-side cursor and are encoded as they arrive,
+    so memory stays flat however large the table is.
+    '''
+    query, keys = vendor_listing(fields)
+    query = query.where(Vendor.id > after_id)
+
+    def generate():
+        yield "["
+        first = True
+        with db.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(query)
+            for batch in result.partitions(STREAM_BATCH_SIZE):
+                chunk = dumps(rows_to_dicts(keys, batch))[1:-1]
+                yield chunk if first else "," + chunk
+                first = False
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
 
 # Request parser for creating/updating vendors
 vendor_parser = reqparse.RequestParser()
 vendor_parser.add_argument("name", type=str, required=True, help="Name of the vendor is required")
 vendor_parser.add_argument("service_type", type=str, required=True, help="Type of service is required")
 vendor_parser.add_argument("price_range", type=str, required=False)
+vendor_parser.add_argument("lat", type=float, required=False)
+vendor_parser.add_argument("lon", type=float, required=False)
+vendor_parser.add_argument("country", type=str, required=False)
+vendor_parser.add_argument("city", type=str, required=False)
+vendor_parser.add_argument("address", type=str, required=False)
+vendor_parser.add_argument("contact", type=str, required=False)
+vendor_parser.add_argument("website", type=str, required=False)
+vendor_parser.add_argument("picture_url", type=str, required=False)
+
+# INDEXED BY: left alone, SQLite prefers the rowid b-tree, which holds the whole row
+VENDOR_VALIDATORS = text(
+    "SELECT row_version, updated_at FROM vendors "
+    "INDEXED BY ix_vendors_id_row_version WHERE id = :id"
+).columns(row_version=db.Integer, updated_at=db.DateTime)
+
+# POST /vendors/bulk limits
+BULK_MAX_ITEMS = 10000
+BULK_BATCH_SIZE = 500
+
+# GET /vendors?ids=... and POST /vendors/lookup limits
+LOOKUP_MAX_IDS = 10000
+LOOKUP_BATCH_SIZE = 500
+
+
+def parse_ids(values):
+    '''positive integer ids from a list of strings/ints; aborts with 400 otherwise
+    '''
+    if not isinstance(values, list):
+        abort(400, message="ids must be a list of vendor ids")
+    if len(values) > LOOKUP_MAX_IDS:
+        abort(413, message=f"At most {LOOKUP_MAX_IDS} ids per request")
+    ids = []
+    for value in values:
+        try:
+            vendor_id = int(value) if not isinstance(value, (bool, float)) else None
+        except (TypeError, ValueError):
+            vendor_id = None
+        if vendor_id is None or vendor_id <= 0:
+            abort(400, message=f"Invalid vendor id: {value!r}")
+        ids.append(vendor_id)
+    return ids
+
+
+def lookup_vendors(ids, fields=VENDOR_FIELDS):
+    '''vendors for ``ids`` in request order, via chunked IN queries
+
+    Unknown ids are returned in place as {"id": ..., "status": "not_found"};
+    repeated ids repeat their vendor.
+    '''
+    columns = serving_columns()
+    if columns is not None:
+        return columns.lookup(ids, fields)
+    query, keys = vendor_listing(fields)
+    unique = list(dict.fromkeys(ids))
+    found = {}
+    for start in range(0, len(unique), LOOKUP_BATCH_SIZE):
+        chunk = unique[start:start + LOOKUP_BATCH_SIZE]
+        for row in db.session.execute(query.where(Vendor.id.in_(chunk))):
+            found[row.id] = dict(zip(keys, row))
+    return [found.get(vendor_id) or {"id": vendor_id, "status": "not_found"} for vendor_id in ids]
+
+
+def validate_vendor(item):
+    '''apply vendor_parser's rules to one bulk item
+
+    Returns (values, errors); values only holds fields the item supplied,
+    plus ``id`` when the item targets an existing vendor.
+    '''
+    if not isinstance(item, dict):
+        return None, {"item": "Expected a JSON object"}
+    values, errors = {}, {}
+    for arg in vendor_parser.args:
+        value = item.get(arg.name)
+        if value is None:
+            if arg.required:
+                errors[arg.name] = arg.help or "Missing required parameter"
+            elif arg.name in item:
+                values[arg.name] = None
+            continue
+        try:
+            values[arg.name] = arg.type(value)
+        except (TypeError, ValueError):
+            errors[arg.name] = f"Invalid value: {value!r}"
+    if item.get("id") is not None:
+        if isinstance(item["id"], int) and not isinstance(item["id"], bool) and item["id"] > 0:
+            values["id"] = item["id"]
+        else:
+            errors["id"] = "id must be a positive integer"
+    return values, errors
+
+
+def read_bulk_items():
+    '''items from a JSON array body or an NDJSON body (one object per line)
+
+    An NDJSON line that is not valid JSON becomes an item carrying the
+    parse error, so it is reported per item rather than failing the batch.
+    '''
+    body = request.get_data(as_text=True)
+    if "ndjson" not in (request.mimetype or "") and body.lstrip().startswith("["):
+        try:
+            items = json.loads(body)
+        except ValueError as e:
+            abort(400, message=f"Invalid JSON: {e}")
+        return items
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append(ValueError(f"Invalid JSON: {e}"))
+    return items
 
 class VendorResource(Resource):
     def get(self, vendor_id):
-        vendor = Vendor.query.get(vendor_id)
-        if not vendor:
+        # ?fields=name,city selects only those columns; hours/links come
+        # from the side tables and are only read when asked for
+        fields = requested_fields(VENDOR_FIELDS + VENDOR_DETAIL_FIELDS)
+
+        # validators come from the covering (id, row_version, updated_at)
+        # index, so a 304 never reads the row itself
+        meta = db.session.execute(VENDOR_VALIDATORS, {"id": vendor_id}).first()
+        if not meta:
             return {"message": "Vendor not found"}, 404
-        return vendor.to_dict(), 200
+        etag = make_etag(vendor_id, meta.row_version, ",".join(fields))
+        last_modified = http_datetime(meta.updated_at)
+        if not_modified(etag, last_modified):
+            return set_validators(Response(status=304), etag, last_modified)
+
+        columns = [field for field in fields if field in VENDOR_FIELDS]
+        row = db.session.execute(
+            select(*vendor_columns(columns)).where(Vendor.id == vendor_id)
+        ).first()
+        body = dict(zip(columns, row))
+        details = [field for field in fields if field in VENDOR_DETAIL_FIELDS]
+        if details:
+            extra = vendor_details([vendor_id])[vendor_id]
+            body.update((field, extra[field]) for field in details)
+        response = api.make_response(body, 200)
+        return set_validators(response, etag, last_modified)
 
     def delete(self, vendor_id):
         vendor = Vendor.query.get(vendor_id)
         if not vendor:
             return {"message": "Vendor not found"}, 404
         db.session.delete(vendor)
+        bump_data_version(db.session)
         db.session.commit()
         return {"message": "Vendor deleted"}, 200
 
 class VendorListResource(Resource):
     def get(self):
-        vendors = Vendor.query.all()
-        return [vendor.to_dict() for vendor in vendors], 200
+        # keyset pagination: ?after_id=<last id seen>&limit=<n>
+        # ?fields=name,city selects only those columns
+        # ?ids=1,2,3 looks up those vendors instead (POST /vendors/lookup for long lists)
+        after_id = request.args.get("after_id", 0, type=int)
+        fields = requested_fields()
+        if request.args.get("ids"):
+            ids = parse_ids([value for value in request.args["ids"].split(",") if value.strip()])
+            return lookup_vendors(ids, fields), 200
+        if request.args.get("stream"):
+            return stream_vendors(after_id, fields)
+
+        limit = page_size(request.args.get("limit"), default=LIST_PAGE_SIZE, maximum=LIST_MAX_PAGE_SIZE)
+        columns = serving_columns()
+        if columns is not None:
+            items = columns.listing(after_id, limit + 1, fields)
+        else:
+            query, keys = vendor_listing(fields)
+            items = rows_to_dicts(keys, db.session.execute(query.where(Vendor.id > after_id).limit(limit + 1)))
+        headers = {}
+        if len(items) > limit:
+            items = items[:limit]
+            next_args = {"after_id": items[-1]["id"], "limit": limit}
+            if request.args.get("fields"):
+                next_args["fields"] = ",".join(fields)
+            headers["Link"] = f'<{url_for("vendorlistresource", **next_args)}>; rel="next"'
+        return items, 200, headers
 
     def post(self):
         args = vendor_parser.parse_args()
@@ -40,12 +273,147 @@ class VendorListResource(Resource):
             name=args["name"],
             service_type=args["service_type"],
             #price_range=args.get("price_range")
-            price_range = args["price_range"]
+            price_range = args["price_range"],
+            lat=args["lat"],
+            lon=args["lon"],
+            country=args["country"],
+            city=args["city"],
+            address=args["address"],
+            contact=args["contact"],
+            website=args["website"],
+            picture_url=args["picture_url"],
         )
         db.session.add(new_vendor)
+        bump_data_version(db.session)
         db.session.commit()
         return new_vendor.to_dict(), 201
 
+class VendorBulkResource(Resource):
+    def post(self):
+        # JSON array or NDJSON; items with an existing id are updated in place
+        items = read_bulk_items()
+        if not isinstance(items, list):
+            return {"message": "Expected a JSON array or NDJSON body"}, 400
+        if len(items) > BULK_MAX_ITEMS:
+            return {"message": f"At most {BULK_MAX_ITEMS} items per request"}, 413
+
+        statuses = [None] * len(items)
+        rows = []
+        seen_ids = set()
+        for i, item in enumerate(items):
+            if isinstance(item, ValueError):
+                statuses[i] = {"index": i, "status": "invalid", "errors": {"item": str(item)}}
+                continue
+            values, errors = validate_vendor(item)
+            # a second item with the same id would hit the primary key mid-batch
+            if values is not None and "id" in values:
+                if values["id"] in seen_ids:
+                    errors["id"] = f"Duplicate id {values['id']} in this request"
+                seen_ids.add(values["id"])
+            if errors:
+                statuses[i] = {"index": i, "status": "invalid", "errors": errors}
+            else:
+                rows.append((i, {**values, **derived_columns(values)}))
+
+        # one IN query tells creates from updates
+        ids = [values["id"] for _, values in rows if values is not None and "id" in values]
+        existing = set()
+        for start in range(0, len(ids), BULK_BATCH_SIZE):
+            chunk = ids[start:start + BULK_BATCH_SIZE]
+            existing.update(db.session.execute(select(Vendor.id).where(Vendor.id.in_(chunk))).scalars())
+
+        updates = [(i, values) for i, values in rows if values.get("id") in existing]
+        creates = [(i, values) for i, values in rows if values.get("id") not in existing]
+
+        for start in range(0, len(updates), BULK_BATCH_SIZE):
+            batch = updates[start:start + BULK_BATCH_SIZE]
+            db.session.execute(update(Vendor), [values for _, values in batch])
+            for i, values in batch:
+                statuses[i] = {"index": i, "status": "updated", "id": values["id"]}
+
+        # multi-row INSERT ... VALUES per batch; RETURNING maps ids back to items
+        insert_fields = [arg.name for arg in vendor_parser.args] + ["name_norm", "country_code"]
+        for with_id in (False, True):
+            group = [(i, values) for i, values in creates if (values is not None and "id" in values) == with_id]
+            fields = insert_fields + (["id"] if with_id else [])
+            for start in range(0, len(group), BULK_BATCH_SIZE):
+                batch = group[start:start + BULK_BATCH_SIZE]
+                new_ids = db.session.execute(
+                    insert(Vendor.__table__).returning(Vendor.id, sort_by_parameter_order=True),
+                    [{field: values.get(field) for field in fields} for _, values in batch],
+                ).scalars().all()
+                for (i, _), new_id in zip(batch, new_ids):
+                    statuses[i] = {"index": i, "status": "created", "id": new_id}
+
+        if rows:
+            bump_data_version(db.session)
+        db.session.commit()
+
+        summary = {}
+        for status in statuses:
+            summary[status["status"]] = summary.get(status["status"], 0) + 1
+        return {"summary": summary, "items": statuses}, 200
+
+class VendorLookupResource(Resource):
+    def post(self):
+        # body: {"ids": [1, 2, 3]} or a bare JSON array; ?fields= as for GET
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            body = body.get("ids")
+        return lookup_vendors(parse_ids(body), requested_fields()), 200
+
+class VendorExportResource(Resource):
+    def get(self):
+        # ?format=ndjson|csv, ?fields=name,city, ?gzip=1 for a .gz download
+        fmt = request.args.get("format", "ndjson")
+        if fmt not in EXPORT_FORMATS:
+            return {"message": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}, 400
+        fields = requested_fields()
+        gzip = bool(request.args.get("gzip"))
+
+        def generate():
+            with db.engine.connect() as connection:
+                yield from export_vendors(connection, fmt, fields, gzip)
+
+        filename = f"vendors.{fmt}" + (".gz" if gzip else "")
+        return Response(
+            stream_with_context(generate()),
+            mimetype="application/gzip" if gzip else MIMETYPES[fmt],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+class VendorSearchResource(Resource):
+    def get(self):
+        # radius mode: ?lat=&lon= or ?near=<city>, plus &radius_km=
+        # ?facets=1 adds service_type / city counts for the whole result set
+        params = request.args
+        criteria = dict(
+            country=params.get("country"),
+            service=params.get("service"),
+            search_term=params.get("q"),
+            near=near_filter(params, serve_city_center),
+            city=params.get("city"),
+        )
+        page = serve_search(
+            cursor=params.get("cursor"),
+            per_page=page_size(params.get("per_page")),
+            **criteria,
+        )
+        body = {
+            "results": rows_to_dicts(RESULT_KEYS, page.results),
+            "next_cursor": page.next_cursor,
+        }
+        if params.get("facets"):
+            body["facets"] = {
+                name: [{"value": value, "count": n} for value, n in counts]
+                for name, counts in serve_facets(**criteria).items()
+            }
+        return body, 200
+
 # Add resources to the API
 api.add_resource(VendorResource, "/vendor/<int:vendor_id>")
-api.add_resource(VendorListResource, "/vendors")
\ No newline at end of file
+api.add_resource(VendorListResource, "/vendors")
+api.add_resource(VendorSearchResource, "/vendors/search")
+api.add_resource(VendorBulkResource, "/vendors/bulk")
+api.add_resource(VendorExportResource, "/vendors/export")
+api.add_resource(VendorLookupResource, "/vendors/lookup")
\ No newline at end of file
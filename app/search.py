@@ -0,0 +1,268 @@
+'''
+Search query builder for the /search page
+'''
+
+import string
+from collections import namedtuple
+
+from sqlalchemy import and_, case, false, func, literal, null, or_, select, union_all
+from sqlalchemy.orm import aliased
+
+from app.countries import country_code
+from app.models import db, Vendor
+from app.geo import GeoFilter, bbox_filter, coordinate, distance_km, radius, rtree
+from app.normalize import normalize_text, prefix_upper_bound
+from app.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor, page_size
+from app.search_index import fts, fts_match, match_expression
+
+# Core-row columns of a result; rows come back as plain tuples (hours for
+# the rendered page come from vendor_details)
+RESULT_COLUMNS = (
+    Vendor.id,
+    Vendor.name,
+    Vendor.service_type,
+    Vendor.address,
+    Vendor.city,
+    Vendor.country,
+    Vendor.contact,
+    Vendor.website,
+    Vendor.picture_url,
+)
+
+# Keys of a search result row: the columns above plus distance and rank
+RESULT_KEYS = tuple(column.key for column in RESULT_COLUMNS) + ("distance_km", "rank")
+
+SearchPage = namedtuple("SearchPage", ["results", "next_cursor"])
+
+# Rank bonus for a vendor whose normalized name equals the normalized term
+# (bm25 ranks are small negative numbers; lower sorts first)
+EXACT_NAME_RANK = -1000.0
+
+# Request parameters that define a search (carried over to "next page" links)
+SEARCH_ARGS = ("country", "service", "city", "search", "near", "lat", "lon", "radius_km")
+
+# Values shown per facet on the results page
+FACET_LIMIT = 10
+
+# SQLite's NOCASE and LIKE fold ASCII letters only, so canonical URLs do
+# too: lowercasing "İstanbul" would no longer match the stored name
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def has_website():
+    '''SQL predicate: vendor has a usable website (not NULL, empty or 'N/A')
+    '''
+    return and_(Vendor.website.isnot(None), Vendor.website != "", Vendor.website != "N/A")
+
+
+def search_filters(country=None, service=None, city=None):
+    '''WHERE clauses for the structured search fields
+    '''
+    filters = [has_website()]
+    if country:
+        code = country_code(country)
+        # unknown names fall back to the old (unindexed) substring match
+        filters.append(Vendor.country_code == code if code else Vendor.country.contains(country))
+    if service:
+        filters.append(Vendor.service_type == service)
+    if city:
+        filters.append(Vendor.city.collate("NOCASE") == city.strip())
+    return filters
+
+
+def city_center(city):
+    '''(lat, lon) centroid of the vendors in a city, or None if unknown
+    '''
+    row = db.session.execute(
+        select(func.avg(Vendor.lat), func.avg(Vendor.lon))
+        .where(Vendor.city.collate("NOCASE") == city.strip(), Vendor.lat.isnot(None))
+    ).first()
+    if row is None or row[0] is None:
+        return None
+    return row[0], row[1]
+
+
+def near_filter(params, locate=city_center):
+    '''read a "within N km" request from ``params`` (lat/lon or near=<city>)
+
+    Returns None when no radius search was asked for. A city that cannot be
+    located by ``locate`` (name -> (lat, lon) or None) yields a GeoFilter
+    with no center, which matches nothing.
+    '''
+    lat = coordinate(params.get("lat"), 90)
+    lon = coordinate(params.get("lon"), 180)
+    city = (params.get("near") or "").strip()
+    if lat is None or lon is None:
+        if not city:
+            return None
+        lat, lon = locate(city) or (None, None)
+    return GeoFilter(lat, lon, radius(params.get("radius_km")))
+
+
+def canonical_search_args(params):
+    '''normalized, ordered search parameters for the canonical GET URL
+
+    Equivalent searches ("Italy"/"IT", extra spaces, ASCII case, default
+    page size) map to one URL, so browsers, proxies and the result cache
+    all share a single entry per search.
+    '''
+    def clean(key):
+        return " ".join((params.get(key) or "").split())
+
+    args = {}
+    country = clean("country")
+    if country:
+        args["country"] = country_code(country) or country.translate(_ASCII_LOWER)
+    for key in ("service", "city", "search", "near"):
+        value = clean(key)
+        if value:
+            args[key] = value if key == "service" else value.translate(_ASCII_LOWER)
+    lat = coordinate(params.get("lat"), 90)
+    lon = coordinate(params.get("lon"), 180)
+    if lat is not None and lon is not None:
+        args["lat"] = f"{lat:.5f}"
+        args["lon"] = f"{lon:.5f}"
+    if "near" in args or "lat" in args:
+        args["radius_km"] = f"{radius(params.get('radius_km')):g}"
+    per_page = page_size(params.get("per_page"))
+    if per_page != DEFAULT_PAGE_SIZE:
+        args["per_page"] = str(per_page)
+    if params.get("cursor"):
+        args["cursor"] = params.get("cursor")
+    return args
+
+
+def text_candidates(match, norm):
+    '''(id, rank) subquery of the vendors a free-text term selects
+
+    FTS matches carry their bm25 rank; vendors found only through the
+    indexed prefix range on the normalized name get 0.0. MATCH runs once
+    here, never per joined row.
+    '''
+    branches = [select(fts.c.rowid.label("id"), fts.c.rank.label("rank")).where(fts_match(match))]
+    if norm:
+        named = aliased(Vendor)
+        branches.append(select(named.id.label("id"), literal(0.0).label("rank")).where(
+            named.name_norm >= norm, named.name_norm < prefix_upper_bound(norm)
+        ))
+    if len(branches) == 1:
+        return branches[0].subquery("candidates")
+    # one row per vendor; bm25 ranks are negative, so min() keeps the FTS rank
+    both = union_all(*branches).subquery("both")
+    return select(both.c.id, func.min(both.c.rank).label("rank")).group_by(both.c.id).subquery("candidates")
+
+
+def _search_clauses(country=None, service=None, search_term=None, near=None, city=None):
+    '''WHERE clauses, rank and distance expressions and text candidates of a search
+
+    Shared by the result page query and the facet counts so both always
+    describe the same set of vendors. ``candidates`` is None without a
+    free-text term; otherwise it must be joined (see _from_vendors).
+    '''
+    filters = search_filters(country, service, city)
+
+    # Free-text terms: candidates come from the FTS index plus an indexed
+    # prefix range on the normalized name; exact name matches rank first
+    match = match_expression(search_term)
+    norm = normalize_text(search_term)
+    rank = literal(0.0)
+    candidates = None
+    if match:
+        candidates = text_candidates(match, norm)
+        rank = candidates.c.rank
+        if norm:
+            rank = rank + case((Vendor.name_norm == norm, EXACT_NAME_RANK), else_=0.0)
+
+    distance = null()
+    if near:
+        if near.lat is None:
+            filters.append(false())
+        else:
+            distance = distance_km(Vendor.lat, Vendor.lon, near)
+            filters.append(bbox_filter(near))
+            filters.append(distance <= near.radius_km)
+            if not match:
+                rank = distance
+    return filters, rank, distance, candidates
+
+
+def _from_vendors(query, near, candidates=None):
+    '''add the text-candidate and R*Tree joins a search needs
+    '''
+    if candidates is not None:
+        query = query.join(candidates, candidates.c.id == Vendor.id)
+    if near and near.lat is not None:
+        query = query.join(rtree, rtree.c.id == Vendor.id)
+    return query
+
+
+def build_search_query(country=None, service=None, search_term=None, after=None, near=None,
+                       city=None):
+    '''build the SELECT for a search, ordered by the (rank, id) keyset
+
+    ``after`` is the decoded (rank, id) key of the previous page's last row;
+    without a text term or radius only its id is used.
+    With a ``near`` GeoFilter, candidates come from the R*Tree bounding box
+    and are then checked with the exact haversine distance; without a text
+    term, results are ranked by that distance.
+    '''
+    filters, rank, distance, candidates = _search_clauses(country, service, search_term, near, city)
+    query = select(*RESULT_COLUMNS, distance.label("distance_km"), rank.label("rank"))
+    query = _from_vendors(query, near, candidates)
+
+    if candidates is None and not (near and near.lat is not None):
+        # filter-only search: every rank is 0.0, so the keyset reduces to
+        # id order, which the primary key / filter indexes return unsorted
+        if after:
+            filters.append(Vendor.id > after[1])
+        return query.where(and_(*filters)).order_by(Vendor.id)
+
+    if after:
+        last_rank, last_id = after
+        filters.append(or_(rank > last_rank, and_(rank == last_rank, Vendor.id > last_id)))
+
+    return query.where(and_(*filters)).order_by(rank, Vendor.id)
+
+
+def search_facets(country=None, service=None, search_term=None, near=None, city=None,
+                  limit=FACET_LIMIT):
+    '''per-value counts of service_type and city over the whole result set
+
+    One statement: the matching rows are collected once in a CTE and both
+    GROUP BYs run over it, combined with UNION ALL.
+    '''
+    filters, _, _, candidates = _search_clauses(country, service, search_term, near, city)
+    matched = _from_vendors(select(Vendor.service_type, Vendor.city), near, candidates)
+    matched = matched.where(and_(*filters)).cte("matched")
+
+    by_service = select(
+        literal("service_type").label("facet"), matched.c.service_type.label("value"),
+        func.count().label("n"),
+    ).group_by(matched.c.service_type)
+    by_city = select(
+        literal("city").label("facet"), matched.c.city.label("value"),
+        func.count().label("n"),
+    ).where(matched.c.city.isnot(None), matched.c.city != "").group_by(matched.c.city)
+
+    facets = {"service_type": [], "city": []}
+    for facet, value, n in db.session.execute(union_all(by_service, by_city)):
+        facets[facet].append((value, n))
+    for name, counts in facets.items():
+        counts.sort(key=lambda item: (-item[1], item[0]))
+        facets[name] = counts[:limit]
+    return facets
+
+
+def search_vendors(country=None, service=None, search_term=None, cursor=None, per_page=20,
+                   near=None, city=None):
+    '''run a search and return one page of row tuples plus the next cursor
+    '''
+    after = decode_cursor(cursor, (float, int))
+    query = build_search_query(country, service, search_term, after, near, city)
+    rows = db.session.execute(query.limit(per_page + 1)).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+    return SearchPage(rows, next_cursor)
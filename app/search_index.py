@@ -0,0 +1,102 @@
+'''
+SQLite FTS5 full-text index over vendors
+'''
+
+import re
+
+from sqlalchemy import column, literal_column, table, text
+
+# External-content FTS5 table: the text lives in ``vendors``, the index only
+# stores tokens. remove_diacritics lets "caffe" match "caffè".
+FTS_TABLE = "vendors_fts"
+FTS_COLUMNS = ("name", "service_type", "city", "address")
+
+_cols = ", ".join(FTS_COLUMNS)
+_new_cols = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+_old_cols = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+
+CREATE_FTS_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    {_cols},
+    content='vendors',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)
+"""
+
+# Triggers keep the index in sync with every write to ``vendors``, whether it
+# comes from the REST resources, the pipeline or a raw sqlite3 session.
+CREATE_FTS_TRIGGERS = (
+    f"""
+CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON vendors BEGIN
+    INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new_cols});
+END
+""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON vendors BEGIN
+    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old_cols});
+END
+""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_cols} ON vendors BEGIN
+    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old_cols});
+    INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new_cols});
+END
+""",
+)
+
+DROP_FTS = (
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+)
+
+# Lightweight handle for joining against the index in queries
+fts = table(FTS_TABLE, column("rowid"), column("rank"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def install_search_index(connection):
+    '''create the FTS table and sync triggers (idempotent)
+    '''
+    connection.execute(text(CREATE_FTS_TABLE))
+    for ddl in CREATE_FTS_TRIGGERS:
+        connection.execute(text(ddl))
+
+
+def rebuild_search_index(connection):
+    '''repopulate the FTS index from the vendors table
+    '''
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def ensure_search_index(engine):
+    '''install the index on an existing database and backfill it if it was missing
+    '''
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).first()
+        install_search_index(connection)
+        if not exists:
+            rebuild_search_index(connection)
+
+
+def match_expression(search_term):
+    '''turn free text into an FTS5 query: every word must match as a prefix
+
+    Returns None when the term has no indexable words.
+    '''
+    tokens = _TOKEN_RE.findall(search_term or "")
+    if not tokens:
+        return None
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def fts_match(expression):
+    '''WHERE clause restricting a query joined to ``fts`` to matching rows
+    '''
+    return literal_column(FTS_TABLE).match(expression)
@@ -0,0 +1,49 @@
+'''
+Fast JSON output for the REST API: Core rows straight to dicts to bytes
+'''
+
+import json
+
+from flask import current_app, make_response
+from flask_restful.representations.json import output_json as restful_output_json
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; the stdlib encoder is the fallback
+    orjson = None
+
+
+def rows_to_dicts(keys, rows):
+    '''map Core result rows to dicts using a key tuple computed once per query
+
+    Skips the ORM entirely: no identity map, no attribute instrumentation,
+    no per-row mapping lookups, just ``zip`` over plain tuples.
+    '''
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def statement_keys(statement):
+    '''output keys of a select(), in column order
+    '''
+    return tuple(column.key for column in statement.selected_columns)
+
+
+def dumps(data):
+    '''encode ``data`` as compact JSON text (orjson when installed)
+    '''
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, separators=(",", ":"))
+
+
+def output_json(data, code, headers=None):
+    '''flask_restful representation for application/json using ``dumps``
+
+    Debug mode and explicit RESTFUL_JSON settings (indent, sort_keys, ...)
+    keep flask_restful's own encoder so their formatting still applies.
+    '''
+    if current_app.debug or current_app.config.get("RESTFUL_JSON"):
+        return restful_output_json(data, code, headers)
+    response = make_response(dumps(data) + "\n", code)
+    response.headers.extend(headers or {})
+    return response
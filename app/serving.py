@@ -0,0 +1,465 @@
+'''
+In-memory columnar serving index for read-mostly deployments
+
+With SERVING_INDEX=1 the vendor table is loaded into compact column
+arrays: ids and coordinates in typed arrays, low-cardinality strings
+(service type, country, city, ...) as integer codes into a shared
+dictionary, and the remaining text as interned strings. Listings, id
+lookups, filter and radius searches, facets and the results-page details
+are answered from these arrays; SQLite only sees writes, free-text
+searches (ranked by FTS5/bm25) and single-vendor conditional GETs.
+
+The index is tagged with the data version it was loaded at. When the
+version moves on, a replacement is built in a background thread and
+requests fall back to SQLite until it is ready, so stale data is never
+served (or cached) under a newer version.
+'''
+
+import heapq
+import logging
+import math
+import string
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, namedtuple
+from itertools import chain, islice
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import select
+
+from app.countries import country_code
+from app.data_version import get_data_version
+from app.geo import bounding_box, haversine_km
+from app.models import VENDOR_FIELDS, Vendor, VendorHours, VendorLink, db, vendor_details
+from app.pagination import decode_cursor, encode_cursor
+from app.search import (
+    FACET_LIMIT, RESULT_KEYS, SearchPage, city_center, search_facets, search_vendors,
+)
+from app.search_index import match_expression
+
+logger = logging.getLogger(__name__)
+
+# Dictionary-coded columns: few distinct values, stored as array("I") codes
+CODED_FIELDS = ("service_type", "price_range", "country", "country_code", "city")
+# Everything else except id/lat/lon: one (interned) string per vendor
+TEXT_FIELDS = tuple(
+    field for field in VENDOR_FIELDS if field not in CODED_FIELDS + ("id", "lat", "lon")
+)
+FACET_FIELDS = ("service_type", "city")
+
+SearchRow = namedtuple("SearchRow", RESULT_KEYS)
+
+# SQLite's NOCASE and LIKE only fold ASCII letters
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+NAN = float("nan")
+
+
+def nocase(text):
+    return text.translate(_ASCII_LOWER)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _coord(value):
+    return NAN if value is None else value
+
+
+def _has_website(value):
+    return value is not None and value not in ("", "N/A")
+
+
+class VendorColumns:
+    '''one immutable, column-oriented copy of the vendors table
+
+    Positions are in id order, so keyset pages are a bisect away.
+    '''
+
+    def __init__(self, version_info, rows, hours=(), links=()):
+        self.version_info = version_info
+        self.ids = array("q")
+        self.lat = array("d")
+        self.lon = array("d")
+        self.website = bytearray()  # 1 where has_website() holds
+        self.codes = {field: array("I") for field in CODED_FIELDS}
+        self.values = {field: [] for field in CODED_FIELDS}
+        self.text = {field: [] for field in TEXT_FIELDS}
+
+        lookups = {field: {} for field in CODED_FIELDS}
+        for row in rows:
+            record = dict(zip(VENDOR_FIELDS, row))
+            self.ids.append(record["id"])
+            self.lat.append(_coord(record["lat"]))
+            self.lon.append(_coord(record["lon"]))
+            self.website.append(_has_website(record["website"]))
+            for field in CODED_FIELDS:
+                value, lookup = record[field], lookups[field]
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(self.values[field])
+                    self.values[field].append(_intern(value))
+                self.codes[field].append(code)
+            for field in TEXT_FIELDS:
+                self.text[field].append(_intern(record[field]))
+
+        # side-table details, only for vendors that have any
+        self.hours = {}
+        for vendor_id, text in hours:
+            self.hours.setdefault(vendor_id, []).append(_intern(text))
+        self.links = {}
+        for vendor_id, kind, url in links:
+            self.links.setdefault(vendor_id, {})[_intern(kind)] = _intern(url)
+
+        # per-code position lists, so filters intersect instead of scanning
+        self.postings = {field: [array("I") for _ in self.values[field]] for field in CODED_FIELDS}
+        for field in CODED_FIELDS:
+            postings = self.postings[field]
+            for i, code in enumerate(self.codes[field]):
+                postings[code].append(i)
+        self.with_website = array("I", (i for i, flag in enumerate(self.website) if flag))
+        self.facet_counts = {
+            field: Counter(map(self.codes[field].__getitem__, self.with_website)) for field in FACET_FIELDS
+        }
+
+        # located vendors sorted by latitude: a radius search bisects its band
+        located = sorted(
+            (lat, i) for i, lat in enumerate(self.lat) if not math.isnan(lat) and not math.isnan(self.lon[i])
+        )
+        self.lat_sorted = array("d", (lat for lat, _ in located))
+        self.lat_order = array("I", (i for _, i in located))
+
+        # [lat sum, lat count, lon sum, lon count] per city code, for city_center()
+        self.city_sums = [[0.0, 0, 0.0, 0] for _ in self.values["city"]]
+        for i, code in enumerate(self.codes["city"]):
+            if not math.isnan(self.lat[i]):
+                sums = self.city_sums[code]
+                sums[0] += self.lat[i]
+                sums[1] += 1
+                if not math.isnan(self.lon[i]):
+                    sums[2] += self.lon[i]
+                    sums[3] += 1
+
+        self.readers = {field: self._reader(field) for field in VENDOR_FIELDS}
+
+    @classmethod
+    def load(cls, session):
+        '''read the data version and every vendor in one read transaction
+
+        Under WAL the whole transaction sees one snapshot, so the version
+        always matches the rows it is stored with.
+        '''
+        version_info = get_data_version(session)
+        columns = [Vendor.__table__.c[field] for field in VENDOR_FIELDS]
+        rows = session.execute(select(*columns).order_by(Vendor.id))
+        hours = session.execute(
+            select(VendorHours.vendor_id, VendorHours.text)
+            .order_by(VendorHours.vendor_id, VendorHours.position)
+        )
+        links = session.execute(select(VendorLink.vendor_id, VendorLink.kind, VendorLink.url))
+        return cls(version_info, rows, hours, links)
+
+    @property
+    def version(self):
+        return self.version_info.version
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _reader(self, field):
+        if field == "id":
+            return self.ids.__getitem__
+        if field in ("lat", "lon"):
+            column = getattr(self, field)
+            return lambda i: None if math.isnan(column[i]) else column[i]
+        if field in CODED_FIELDS:
+            codes, values = self.codes[field], self.values[field]
+            return lambda i: values[codes[i]]
+        return self.text[field].__getitem__
+
+    def record(self, i, fields=VENDOR_FIELDS):
+        readers = self.readers
+        return {field: readers[field](i) for field in fields}
+
+    def position(self, vendor_id):
+        '''array position of ``vendor_id``, or None
+        '''
+        i = bisect_left(self.ids, vendor_id)
+        if i < len(self.ids) and self.ids[i] == vendor_id:
+            return i
+        return None
+
+    def listing(self, after_id=0, limit=100, fields=VENDOR_FIELDS):
+        '''vendors with id > ``after_id`` as dicts, at most ``limit``
+        '''
+        start = bisect_left(self.ids, after_id + 1)
+        return [self.record(i, fields) for i in range(start, min(start + limit, len(self.ids)))]
+
+    def lookup(self, ids, fields=VENDOR_FIELDS):
+        '''same contract as resources.lookup_vendors
+        '''
+        results = []
+        for vendor_id in ids:
+            i = self.position(vendor_id)
+            results.append(self.record(i, fields) if i is not None
+                           else {"id": vendor_id, "status": "not_found"})
+        return results
+
+    def details(self, ids):
+        '''same contract as models.vendor_details
+        '''
+        return {
+            vendor_id: {"hours": list(self.hours.get(vendor_id, ())),
+                        "links": dict(self.links.get(vendor_id, {}))}
+            for vendor_id in ids
+        }
+
+    def _allowed_codes(self, field, keep):
+        '''set of dictionary codes of ``field`` whose value passes ``keep``
+        '''
+        return {code for code, value in enumerate(self.values[field]) if keep(value)}
+
+    def _conditions(self, country=None, service=None, city=None):
+        '''[(field, allowed codes)] for the structured search fields
+
+        Mirrors search.search_filters: country code equality (substring
+        match for unknown names), exact service type, NOCASE city.
+        '''
+        conditions = []
+        if country:
+            code = country_code(country)
+            if code:
+                conditions.append(("country_code", lambda value: value == code))
+            else:
+                needle = nocase(country)
+                conditions.append(("country", lambda value: value is not None and needle in nocase(value)))
+        if service:
+            conditions.append(("service_type", lambda value: value == service))
+        if city:
+            wanted = nocase(city.strip())
+            conditions.append(("city", lambda value: value is not None and nocase(value) == wanted))
+        return [(field, self._allowed_codes(field, keep)) for field, keep in conditions]
+
+    def _filter(self, conditions):
+        '''(driver, accepts) for a list of conditions
+
+        ``driver`` is the shortest sorted position list every match must be
+        in: the website list or one condition's postings. ``accepts(i)``
+        checks a position against the website test and all conditions.
+        '''
+        driver, size = self.with_website, len(self.with_website)
+        for field, allowed in conditions:
+            postings = self.postings[field]
+            n = sum(len(postings[code]) for code in allowed)
+            if n < size:
+                driver, size = (field, allowed), n
+        if isinstance(driver, tuple):
+            field, allowed = driver
+            postings = self.postings[field]
+            if len(allowed) == 1:
+                driver = postings[next(iter(allowed))]
+            else:
+                driver = array("I", sorted(chain.from_iterable(postings[code] for code in allowed)))
+
+        website = self.website
+        checks = [(self.codes[field], allowed) for field, allowed in conditions]
+        return driver, lambda i: website[i] and all(codes[i] in allowed for codes, allowed in checks)
+
+    def _near_matches(self, near, driver, accepts):
+        '''[(distance, id, position)] within ``near``
+
+        Walks the latitude band of the bounding box (bisected out of the
+        lat-sorted array) or ``driver``, whichever is shorter.
+        '''
+        south, west, north, east = bounding_box(near.lat, near.lon, near.radius_km)
+        lo = bisect_left(self.lat_sorted, south)
+        hi = bisect_right(self.lat_sorted, north)
+        positions = self.lat_order[lo:hi] if hi - lo <= len(driver) else driver
+        lat, lon, ids = self.lat, self.lon, self.ids
+        matches = []
+        for i in positions:
+            # NaN (no coordinates) fails every comparison
+            if not (south <= lat[i] <= north and west <= lon[i] <= east) or not accepts(i):
+                continue
+            distance = haversine_km(lat[i], lon[i], near.lat, near.lon)
+            if distance <= near.radius_km:
+                matches.append((distance, ids[i], i))
+        return matches
+
+    def search(self, country=None, service=None, cursor=None, per_page=20, near=None, city=None):
+        '''one page of SearchRows plus the next cursor (filter/radius searches)
+
+        Same (rank, id) keyset as search.search_vendors, where rank is the
+        distance for radius searches and 0.0 otherwise. Filter-only pages
+        resume from the cursor's id with a bisect.
+        '''
+        conditions = self._conditions(country, service, city)
+        after = decode_cursor(cursor, (float, int))
+        page = []
+        if all(allowed for _, allowed in conditions) and not (near and near.lat is None):
+            driver, accepts = self._filter(conditions)
+            if near:
+                matches = self._near_matches(near, driver, accepts)
+                if after:
+                    matches = [m for m in matches if (m[0], m[1]) > after]
+                page = [(i, distance, distance) for distance, _, i in heapq.nsmallest(per_page + 1, matches)]
+            elif not after or after[0] <= 0.0:
+                # every rank is 0.0: the keyset reduces to id order
+                start = bisect_right(self.ids, after[1]) if after and after[0] == 0.0 else 0
+                positions = islice(driver, bisect_left(driver, start), None)
+                page = [(i, 0.0, None) for i in islice(filter(accepts, positions), per_page + 1)]
+
+        rows = [self._search_row(i, rank, distance) for i, rank, distance in page]
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+        return SearchPage(rows, next_cursor)
+
+    def _search_row(self, i, rank, distance):
+        readers = self.readers
+        return SearchRow(*(readers[key](i) for key in RESULT_KEYS[:-2]), distance, rank)
+
+    def facets(self, country=None, service=None, near=None, city=None, limit=FACET_LIMIT):
+        '''same contract as search.search_facets
+        '''
+        conditions = self._conditions(country, service, city)
+        counts = {field: Counter() for field in FACET_FIELDS}
+        if not conditions and not near:
+            counts = self.facet_counts
+        elif all(allowed for _, allowed in conditions) and not (near and near.lat is None):
+            driver, accepts = self._filter(conditions)
+            if near:
+                positions = [i for _, _, i in self._near_matches(near, driver, accepts)]
+            else:
+                positions = list(filter(accepts, driver))
+            for field in FACET_FIELDS:
+                counts[field] = Counter(map(self.codes[field].__getitem__, positions))
+
+        facets = {
+            field: [(self.values[field][code], n) for code, n in counts[field].items()
+                    if field != "city" or self.values[field][code] not in (None, "")]
+            for field in FACET_FIELDS
+        }
+        for name, items in facets.items():
+            items.sort(key=lambda item: (-item[1], item[0]))
+            facets[name] = items[:limit]
+        return facets
+
+    def city_center(self, city):
+        '''same contract as search.city_center
+        '''
+        wanted = nocase(city.strip())
+        allowed = self._allowed_codes("city", lambda value: value is not None and nocase(value) == wanted)
+        lat_sum = lat_n = lon_sum = lon_n = 0
+        for code in allowed:
+            sums = self.city_sums[code]
+            lat_sum, lat_n = lat_sum + sums[0], lat_n + sums[1]
+            lon_sum, lon_n = lon_sum + sums[2], lon_n + sums[3]
+        if not lat_n:
+            return None
+        return lat_sum / lat_n, (lon_sum / lon_n if lon_n else None)
+
+
+class ServingIndex:
+    '''holds the VendorColumns for the current data version
+
+    Same lifecycle as suggest.Suggester: rebuilt in a background thread
+    when the data version changes, swapped in with one assignment. Rebuilds
+    start at most once per ``rebuild_interval`` seconds, so a stream of
+    single-row writes costs one reload per interval, not one per write.
+    '''
+
+    def __init__(self, app, monitor, rebuild_interval=5.0):
+        self.app = app
+        self.monitor = monitor
+        self.rebuild_interval = rebuild_interval
+        self.columns = None
+        self._building = False
+        self._started_at = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        with self.app.app_context():
+            columns = VendorColumns.load(db.session)
+            db.session.remove()
+        self.columns = columns
+        logger.info(f"Serving index loaded: {len(columns)} vendors (data version {columns.version})")
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Serving index rebuild failed")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def current(self):
+        '''the columns if they match the current data version, else None
+
+        A mismatch starts a background rebuild (debounced); callers use
+        SQLite until it has been swapped in.
+        '''
+        columns = self.columns
+        if columns is not None and columns.version == self.monitor.current():
+            return columns
+        now = time.monotonic()
+        with self._lock:
+            due = self._started_at is None or now - self._started_at >= self.rebuild_interval
+            if not self._building and due:
+                self._building = True
+                self._started_at = now
+                threading.Thread(target=self._rebuild, daemon=True).start()
+        return None
+
+
+def serving_columns():
+    '''VendorColumns to answer the current request from, or None for SQLite
+
+    Resolved once per request, so a background swap never mixes two
+    versions in one response.
+    '''
+    if not has_app_context():
+        return None
+    if "serving_columns" not in g:
+        index = current_app.extensions.get("serving_index")
+        g.serving_columns = index.current() if index is not None else None
+    return g.serving_columns
+
+
+def serve_search(country=None, service=None, search_term=None, cursor=None, per_page=20,
+                 near=None, city=None):
+    '''search.search_vendors, from memory unless there is a free-text term
+    '''
+    columns = serving_columns()
+    if columns is None or match_expression(search_term):
+        return search_vendors(country, service, search_term, cursor, per_page, near, city)
+    return columns.search(country, service, cursor, per_page, near, city)
+
+
+def serve_facets(country=None, service=None, search_term=None, near=None, city=None):
+    '''search.search_facets, from memory unless there is a free-text term
+    '''
+    columns = serving_columns()
+    if columns is None or match_expression(search_term):
+        return search_facets(country, service, search_term, near, city)
+    return columns.facets(country, service, near, city)
+
+
+def serve_city_center(city):
+    columns = serving_columns()
+    if columns is None:
+        return city_center(city)
+    return columns.city_center(city)
+
+
+def serve_details(ids):
+    columns = serving_columns()
+    if columns is None:
+        return vendor_details(ids)
+    return columns.details(ids)
@@ -0,0 +1,139 @@
+'''
+Database snapshots: build a complete new file, then swap it in atomically
+
+Replacing a live SQLite file underneath open WAL connections can corrupt
+it, so snapshots never overwrite anything. Each load writes a new file
+next to the live one (vendors-<timestamp>.db), and a small pointer file
+(vendors.db.current) names the snapshot in use. Engines resolve the
+pointer whenever they open a connection (see engine.tune_engine), and
+the swap itself is one atomic os.replace() of the pointer.
+'''
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+POINTER_SUFFIX = ".current"
+# Snapshots kept on disk: the live one plus one to roll back to
+SNAPSHOT_KEEP = 2
+
+
+def pointer_path(path):
+    return path + POINTER_SUFFIX
+
+
+def resolve_database(path):
+    '''file currently serving as ``path``: its snapshot if one is active
+
+    Without a pointer file (or if it names a missing file) ``path`` itself
+    is used, so databases that never had a snapshot behave as before.
+    '''
+    if not path or path == ":memory:" or path.startswith("file:"):
+        return path
+    try:
+        with open(pointer_path(path)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return path
+    target = os.path.join(os.path.dirname(path), name)
+    return target if name and os.path.exists(target) else path
+
+
+def new_snapshot_path(path):
+    '''vendors.db -> vendors-20261017T201500123456.db in the same directory
+    '''
+    stem, ext = os.path.splitext(path)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    return f"{stem}-{stamp}{ext}"
+
+
+def copy_database(source, target):
+    '''consistent online copy via the SQLite backup API (safe during writes)
+    '''
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def finalize_snapshot(path):
+    '''refresh planner statistics and fold the WAL back into the main file
+    '''
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("ANALYZE")
+        connection.execute("PRAGMA optimize")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def activate_snapshot(path, snapshot):
+    '''point ``path`` at ``snapshot`` (atomic) and prune older snapshots
+    '''
+    pointer = pointer_path(path)
+    tmp = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(os.path.basename(snapshot))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+    prune_snapshots(path)
+
+
+def prune_snapshots(path, keep=SNAPSHOT_KEEP):
+    '''delete all but the newest ``keep`` snapshot files of ``path``
+
+    Connections still open on a deleted snapshot keep reading it until
+    they close (POSIX unlink semantics).
+    '''
+    directory = os.path.dirname(path) or "."
+    stem, ext = os.path.splitext(os.path.basename(path))
+    active = os.path.basename(resolve_database(path))
+    snapshots = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(stem + "-") and name.endswith(ext)
+    )
+    for name in snapshots[:-keep] if keep else snapshots:
+        if name == active:
+            continue
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+class SnapshotWatcher:
+    '''notices when the pointer file of ``path`` changes
+
+    ``changed()`` stats the pointer at most once per ``poll_interval``
+    seconds and returns True once per swap.
+    '''
+
+    def __init__(self, path, poll_interval=1.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.active = resolve_database(path)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.poll_interval:
+            return False
+        with self._lock:
+            if now - self._checked_at < self.poll_interval:
+                return False
+            self._checked_at = now
+            active = resolve_database(self.path)
+            if active == self.active:
+                return False
+            self.active = active
+            return True
@@ -0,0 +1,253 @@
+'''
+Typeahead suggestions from an in-memory prefix index
+'''
+
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+
+from sqlalchemy import String, select, type_coerce
+
+from app.models import db, Vendor
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+
+# Above this many changed vendors a refresh re-sorts the whole index
+# instead of inserting and removing keys one by one
+DELTA_LIMIT = 2000
+
+# Vendors whose name/city are fetched per query during a delta refresh
+FETCH_CHUNK = 500
+
+# What marks a vendor row as changed; updated_at is compared as stored
+# text, which skips datetime parsing on the full-table scan
+STAMP_COLUMNS = (Vendor.row_version, type_coerce(Vendor.updated_at, String))
+
+
+def fold(text):
+    '''lowercase, strip accents and collapse whitespace, for matching only
+    '''
+    text = unicodedata.normalize("NFD", (text or "").lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return " ".join(text.split())
+
+
+def index_keys(label):
+    '''folded keys for ``label``, one per word start
+    '''
+    words = fold(label).split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    '''sorted array of folded keys, searched with bisect
+
+    Each label is indexed from every word start, so "mon" finds
+    "Villa Mondello" as well as "Monreale".
+    '''
+
+    __slots__ = ("keys", "entries")
+
+    def __init__(self, keys=(), entries=()):
+        self.keys = list(keys)
+        self.entries = list(entries)
+
+    @classmethod
+    def build(cls, terms):
+        '''build from (label, kind) pairs; duplicates are dropped
+        '''
+        pairs = set()
+        for label, kind in terms:
+            label = (label or "").strip()
+            if not label:
+                continue
+            for key in index_keys(label):
+                pairs.add((key, label, kind))
+        ordered = sorted(pairs)
+        return cls((key for key, _, _ in ordered), ((label, kind) for _, label, kind in ordered))
+
+    def apply(self, added=(), removed=()):
+        '''copy of this index with (label, kind) entries added and removed
+
+        Each key is placed with bisect, so the copy is ordered exactly as
+        build() would order it.
+        '''
+        index = PrefixIndex(self.keys, self.entries)
+        for entry in removed:
+            for key in index_keys(entry[0]):
+                i = index._find(key, entry)
+                if i < len(index.keys) and index.keys[i] == key and index.entries[i] == entry:
+                    del index.keys[i]
+                    del index.entries[i]
+        for entry in added:
+            for key in index_keys(entry[0]):
+                i = index._find(key, entry)
+                if i == len(index.keys) or index.keys[i] != key or index.entries[i] != entry:
+                    index.keys.insert(i, key)
+                    index.entries.insert(i, entry)
+        return index
+
+    def _find(self, key, entry):
+        '''position of (key, entry) in (key, label, kind) order
+        '''
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key and self.entries[i] < entry:
+            i += 1
+        return i
+
+    def search(self, prefix, limit=SUGGEST_LIMIT):
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        results, seen = [], set()
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix) and len(results) < limit:
+            entry = self.entries[i]
+            if entry not in seen:
+                seen.add(entry)
+                results.append(entry)
+            i += 1
+        return results
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def vendor_terms(name, city):
+    '''the (label, kind) entries one vendor contributes
+    '''
+    terms = []
+    for label, kind in ((name, "vendor"), (city, "city")):
+        label = (label or "").strip()
+        if label:
+            terms.append((label, kind))
+    return tuple(terms)
+
+
+class Suggester:
+    '''serves suggestions from the current PrefixIndex
+
+    When the data version moves on, a replacement index is prepared in a
+    background thread while the old one keeps answering; the swap is a
+    single attribute assignment. Refreshes are incremental: each vendor's
+    (row_version, updated_at) is remembered, the covering
+    ix_vendors_id_row_version index shows which rows were inserted,
+    changed or deleted since, and only their terms are re-read and
+    applied. A label shared by several vendors (a city, a common name)
+    stays indexed until the last of them is gone.
+    '''
+
+    def __init__(self, app, monitor):
+        self.app = app
+        self.monitor = monitor
+        self.index = PrefixIndex()
+        self.version = None
+        # vendor id -> ((row_version, updated_at), terms)
+        self.vendors = {}
+        # (label, kind) -> number of vendors contributing it
+        self.counts = Counter()
+        self._building = False
+        self._lock = threading.Lock()
+
+    def build(self, version=None):
+        '''load every vendor and build the index from scratch
+        '''
+        vendors, counts = {}, Counter()
+        with self.app.app_context():
+            rows = db.session.execute(
+                select(Vendor.id, *STAMP_COLUMNS, Vendor.name, Vendor.city)
+            )
+            for vendor_id, row_version, updated_at, name, city in rows:
+                terms = vendor_terms(name, city)
+                vendors[vendor_id] = ((row_version, updated_at), terms)
+                counts.update(terms)
+            db.session.remove()
+        index = PrefixIndex.build(counts)
+        self.vendors, self.counts = vendors, counts
+        self.index = index
+        self.version = version
+        logger.info(f"Suggestion index rebuilt: {len(index)} keys (data version {version})")
+
+    def update(self, version=None):
+        '''apply the vendors changed since the last build or update
+        '''
+        with self.app.app_context():
+            # a Core connection read: no ORM row processing for 50k rows
+            rows = db.session.connection().execute(select(Vendor.id, *STAMP_COLUMNS))
+            stamps = {vendor_id: (row_version, updated_at) for vendor_id, row_version, updated_at in rows}
+            known = self.vendors
+            changed = [i for i, stamp in stamps.items() if i not in known or known[i][0] != stamp]
+            deleted = [i for i in known if i not in stamps]
+            if len(changed) + len(deleted) > DELTA_LIMIT:
+                db.session.remove()
+                return self.build(version)
+            fresh = {}
+            for start in range(0, len(changed), FETCH_CHUNK):
+                chunk = changed[start:start + FETCH_CHUNK]
+                rows = db.session.execute(
+                    select(Vendor.id, *STAMP_COLUMNS, Vendor.name, Vendor.city)
+                    .where(Vendor.id.in_(chunk))
+                )
+                for vendor_id, row_version, updated_at, name, city in rows:
+                    fresh[vendor_id] = ((row_version, updated_at), vendor_terms(name, city))
+            db.session.remove()
+
+        vendors, counts = dict(known), Counter(self.counts)
+        added, removed = set(), set()
+        for vendor_id in deleted + [i for i in changed if i not in fresh]:
+            for term in vendors.pop(vendor_id, (None, ()))[1]:
+                counts[term] -= 1
+                if not counts[term]:
+                    del counts[term]
+                    removed.add(term)
+        for vendor_id, (stamp, terms) in fresh.items():
+            old_terms = vendors[vendor_id][1] if vendor_id in vendors else ()
+            vendors[vendor_id] = (stamp, terms)
+            for term in old_terms:
+                counts[term] -= 1
+                if not counts[term]:
+                    del counts[term]
+                    removed.add(term)
+            for term in terms:
+                if not counts[term]:
+                    added.add(term)
+                counts[term] += 1
+        # a label can drop to zero and come back within one delta
+        index = self.index.apply(added - removed, removed - added)
+        self.vendors, self.counts = vendors, counts
+        self.index = index
+        self.version = version
+        logger.info(
+            f"Suggestion index updated: {len(fresh)} changed, {len(deleted)} deleted, "
+            f"{len(index)} keys (data version {version})"
+        )
+
+    def _rebuild(self, version):
+        try:
+            self.update(version)
+        except Exception:
+            logger.exception("Suggestion index rebuild failed")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def refresh(self):
+        '''start a background rebuild if the data version changed
+        '''
+        version = self.monitor.current()
+        if version == self.version:
+            return
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild, args=(version,), daemon=True).start()
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        self.refresh()
+        return self.index.search(prefix, limit)
@@ -2,13 +2,18 @@
 import os
 import json
 import logging
+import sys
 import argparse
-import unicodedata
 from typing import Any, Dict, List, Tuple, Optional
 from collections import Counter
 
 import pandas as pd
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Shared with the web app, which stores the same normalization in vendors.name_norm
+from app.normalize import normalize_text as _normalize_text
+
 # Configure logging
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(
@@ -46,38 +51,6 @@ def _load_json(path: str) -> List[Dict[str, Any]]:
         return []
 
 
-def _normalize_text(s: Optional[str]) -> str:
-    """
-    Normalize a string for comparison: lowercase, strip, remove diacritics and punctuation,
-    and drop common company suffixes.
-    """
-    if not s:
-        return ""
-    s = s.strip().lower()
-
-    # Remove accents
-    s = "".join(
-        c for c in unicodedata.normalize("NFD", s)
-        if unicodedata.category(c) != "Mn"
-    )
-
-    # Replace punctuation with spaces
-    punct = r"""!"#$%&'()*+,-./:;<=>?@[\]^_`{|}~"""
-    s = s.translate(str.maketrans({c: " " for c in punct}))
-
-    # Collapse whitespace
-    s = " ".join(s.split())
-
-    # Remove common company tokens
-    tokens = s.split()
-    drop = {
-        "srl", "s.r.l.", "spa", "s.p.a.", "sas", "snc", "ltd", "co", "inc",
-        "di", "del", "della", "dei", "degli", "studio", "the"
-    }
-    tokens = [t for t in tokens if t not in drop]
-    return " ".join(tokens)
-
-
 def _round_or_none(v: Any, decimals: int = 3) -> Optional[float]:
     """
     Safely round numeric value or return None.
@@ -225,4 +225,10 @@ OSM_TAGS = [
 ]
 
 # Database URI (override in .env if needed)
-DATABASE_URI = os.getenv("DATABASE_URI", "sqlite:///vendors.db")
\ No newline at end of file
+DATABASE_URI = os.getenv("DATABASE_URI", "sqlite:///vendors.db")
+
+# Bulk loader (data_processor): rows per executemany batch, and the number
+# of written vendors from which FTS/R*Tree/secondary index upkeep is
+# deferred to one rebuild at the end of the load
+LOAD_BATCH_SIZE = _env_int("LOAD_BATCH_SIZE", 1000)
+LOAD_DEFER_INDEX_ROWS = _env_int("LOAD_DEFER_INDEX_ROWS", 1000)
@@ -6,9 +6,13 @@ information in JSON format and that the database schema is already defined in mo
 """
 
 # data_processor.py
+import argparse
 import json
-from sqlalchemy import create_engine, exc
-from sqlalchemy.orm import sessionmaker
+import time
+from contextlib import contextmanager
+from sqlalchemy import bindparam, delete, insert, select, text, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
 #from models import db, Vendor  # Assume models.py has db and Vendor
 
 import config
@@ -18,59 +22,396 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.models import db, Vendor
+from app.models import db, Vendor, VendorHours, VendorLink, VendorSource, clean_links
+from app.countries import country_code
+from app.normalize import normalize_text, parse_hours
+from app.search_index import FTS_TABLE, ensure_search_index, install_search_index, rebuild_search_index
+from app.geo import RTREE_TABLE, ensure_geo_index, install_geo_index, rebuild_geo_index
+from app.data_version import bump_data_version, get_data_version
+from app.engine import create_tuned_engine
+from app.snapshot import activate_snapshot, copy_database, finalize_snapshot, new_snapshot_path, resolve_database
 load_dotenv()
 
-engine = create_engine(config.DATABASE_URI)
-Session = sessionmaker(bind=engine)
-db.Model.metadata.create_all(engine)  # Init tables if needed
 
-def process_and_store(input_files):
-    all_vendors = []
+def prepare_database(engine):
+    """
+    Create missing tables and search indexes on ``engine``'s database.
+
+    Args:
+        engine: SQLAlchemy engine.
+    """
+    db.Model.metadata.create_all(engine)  # Init tables if needed
+    ensure_search_index(engine)  # FTS table + sync triggers on older databases
+    ensure_geo_index(engine)  # R*Tree over lat/lon, same deal
+
+
+engine = create_tuned_engine(config.DATABASE_URI)  # WAL: the site keeps serving during loads
+prepare_database(engine)
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Row-value IN lookups per round trip when resolving provenance keys
+RESOLVE_BATCH_SIZE = 500
+
+
+def source_key(v):
+    """
+    Provenance key of a pipeline record.
+
+    Args:
+        v (dict): Vendor record; OSM records carry ``osm_id``, Yelp and
+            Foursquare records ``source`` plus ``source_id``.
+
+    Returns:
+        tuple | None: ``(source, source_id)`` with the source lowercased,
+        or None when the record cannot be traced back to its source.
+    """
+    source = (v.get("source") or "").strip().lower()
+    source_id = v.get("source_id") or v.get("osm_id")
+    if not source or not source_id:
+        return None
+    return source, str(source_id)
+
+
+def resolve_vendor_ids(connection, keys):
+    """
+    Map provenance keys to existing vendor ids.
+
+    Uses the unique (source, source_id) index, a batch of keys per query.
+
+    Args:
+        connection: SQLAlchemy connection (or session).
+        keys (list[tuple]): ``(source, source_id)`` pairs.
+
+    Returns:
+        dict: ``{(source, source_id): vendor_id}`` for the keys already stored.
+    """
+    found = {}
+    for start in range(0, len(keys), RESOLVE_BATCH_SIZE):
+        chunk = keys[start:start + RESOLVE_BATCH_SIZE]
+        rows = connection.execute(
+            select(VendorSource.source, VendorSource.source_id, VendorSource.vendor_id)
+            .where(tuple_(VendorSource.source, VendorSource.source_id).in_(chunk))
+        )
+        for source, source_id, vendor_id in rows:
+            found[(source, source_id)] = vendor_id
+    return found
+
+
+def vendor_values(v):
+    """
+    Core vendor columns for a pipeline record.
+
+    Args:
+        v (dict): Vendor record with defaults already applied.
+
+    Returns:
+        dict: Column values for the ``vendors`` table (same keys for every record).
+    """
+    # TODO: possibly wrong tags mapping from source to DB fields
+    return dict(
+        name=v["name"],
+        name_norm=normalize_text(v["name"]),
+        country=v["country"],
+        country_code=country_code(v["country"]),
+        service_type=v["service_type"],
+        price_range=v["price_range"],
+        address=v.get("address"),
+        city=v.get("city"),
+        lat=_float_or_none(v.get("lat")),
+        lon=_float_or_none(v.get("lon")),
+        contact=v.get("contact"),
+        picture_url=v.get("picture_url"),
+        website=v.get("website"),
+    )
+
+
+def read_records(input_files):
+    """
+    Read, deduplicate and default the vendor records of ``input_files``.
+
+    Args:
+        input_files (list[str]): JSON files of vendor records.
+
+    Returns:
+        list[dict]: One record per provenance key (else per name + address).
+    """
+    unique_vendors = {}
     for file in input_files:
         with open(file, "r") as f:
-            all_vendors.extend(json.load(f))
-    
-    # Deduplicate by name + address
-    unique_vendors = {}
-    for v in all_vendors:
-        key = (v["name"].lower(), v.get("address", "").lower())
-        if key not in unique_vendors:
-            unique_vendors[key] = v
-    
-    session = Session()
+            for v in json.load(f):
+                key = source_key(v) or (v["name"].lower(), (v.get("address") or "").lower())
+                if key not in unique_vendors:
+                    unique_vendors[key] = v
     for v in unique_vendors.values():
         # Normalize (e.g., add defaults)
         v["country"] = v.get("country", "Italy")
         v["price_range"] = v.get("price_range", "Unknown")  # Placeholder; enrich later if needed
-        
-        # TODO: possibly wrong tags mapping from source to DB fields
-        vendor = Vendor(
-            name=v["name"],
-            country=v["country"],
-            service_type=v["service_type"],
-            price_range=v["price_range"],
-            address=v.get("address"),
-            city=v.get("city"),
-            contact=v.get("contact"),
-            hours=v.get("hours"),
-            picture_url=v.get("picture_url"),
-            website=v.get("website"),
-            # Social fields: Placeholder; scrape/enrich in future phases
+    return list(unique_vendors.values())
+
+
+def load_current(connection, ids, batch_size):
+    """
+    Stored state of the vendors a load is about to update.
+
+    Args:
+        connection: SQLAlchemy connection.
+        ids (list[int]): Vendor ids.
+        batch_size (int): Ids per IN query.
+
+    Returns:
+        dict: ``{vendor_id: {"row": mapping, "hours": [...], "links": {...}}}``.
+    """
+    vendors = Vendor.__table__
+    current = {}
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        for row in connection.execute(select(vendors).where(vendors.c.id.in_(chunk))):
+            current[row.id] = {"row": row._mapping, "hours": [], "links": {}}
+        hours = connection.execute(
+            select(VendorHours.vendor_id, VendorHours.text)
+            .where(VendorHours.vendor_id.in_(chunk))
+            .order_by(VendorHours.vendor_id, VendorHours.position)
+        )
+        for vendor_id, line in hours:
+            current[vendor_id]["hours"].append(line)
+        links = connection.execute(
+            select(VendorLink.vendor_id, VendorLink.kind, VendorLink.url).where(VendorLink.vendor_id.in_(chunk))
         )
-        try:
-            session.add(vendor)
-            session.commit()
-        except exc.IntegrityError:
-            session.rollback()  # Skip duplicates
-    
-    session.close()
-    print(f"Stored {len(unique_vendors)} unique vendors in DB.")
+        for vendor_id, kind, url in links:
+            current[vendor_id]["links"][kind] = url
+    return current
+
+
+@contextmanager
+def deferred_index_maintenance(connection, enabled=True):
+    """
+    Suspend FTS/R*Tree triggers and secondary vendor indexes during a load.
+
+    Per-row trigger and index upkeep is replaced by one rebuild when the
+    block exits. Must run inside the load's transaction: SQLite DDL is
+    transactional, so a failed load rolls the drops back as well.
+
+    Args:
+        connection: SQLAlchemy connection with an open transaction.
+        enabled (bool): When False, indexes are maintained row by row as usual.
+    """
+    if not enabled:
+        yield
+        return
+    indexes = [index for index in Vendor.__table__.indexes if not index.unique]
+    for table in (FTS_TABLE, RTREE_TABLE):
+        for suffix in ("ai", "ad", "au"):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {table}_{suffix}"))
+    for index in indexes:
+        index.drop(connection, checkfirst=True)
+
+    yield
+
+    for index in indexes:
+        index.create(connection)
+    rebuild_search_index(connection)
+    rebuild_geo_index(connection)
+    install_search_index(connection)
+    install_geo_index(connection)
+
+
+def insert_vendors(connection, creates, batch_size):
+    """
+    Insert new vendors and their hours, links and sources.
+
+    Args:
+        connection: SQLAlchemy connection.
+        creates (list[tuple]): ``(source key, values, hours, links)`` per vendor.
+        batch_size (int): Vendors per executemany batch.
+    """
+    vendors = Vendor.__table__
+    # RETURNING maps the generated ids back to the batch, in order
+    insert_vendor = insert(vendors).returning(vendors.c.id, sort_by_parameter_order=True)
+    for start in range(0, len(creates), batch_size):
+        batch = creates[start:start + batch_size]
+        ids = connection.execute(insert_vendor, [values for _, values, _, _ in batch]).scalars().all()
+        hours_rows, link_rows, source_rows = [], [], []
+        for vendor_id, (key, _, hours, links) in zip(ids, batch):
+            hours_rows.extend({"vendor_id": vendor_id, "position": position, "text": line}
+                              for position, line in enumerate(hours))
+            link_rows.extend({"vendor_id": vendor_id, "kind": kind, "url": url} for kind, url in links.items())
+            if key:
+                source_rows.append({"vendor_id": vendor_id, "source": key[0], "source_id": key[1]})
+        for table, rows in ((VendorHours.__table__, hours_rows), (VendorLink.__table__, link_rows),
+                            (VendorSource.__table__, source_rows)):
+            if rows:
+                connection.execute(insert(table), rows)
+
+
+def update_vendors(connection, updates, batch_size):
+    """
+    Update changed vendors in place, with their hours and links.
+
+    Every updated row gets a new row_version / updated_at (column
+    onupdate), so ETags only change for vendors whose data did.
+
+    Args:
+        connection: SQLAlchemy connection.
+        updates (list[tuple]): ``(vendor_id, values, hours, links)``; hours is
+            None when unchanged, links holds only new or changed kinds.
+        batch_size (int): Vendors per executemany batch.
+    """
+    vendors = Vendor.__table__
+    hours_table = VendorHours.__table__
+    update_vendor = update(vendors).where(vendors.c.id == bindparam("b_id"))
+    upsert_link = sqlite_insert(VendorLink.__table__)
+    upsert_link = upsert_link.on_conflict_do_update(
+        index_elements=["vendor_id", "kind"], set_={"url": upsert_link.excluded.url}
+    )
+    for start in range(0, len(updates), batch_size):
+        batch = updates[start:start + batch_size]
+        connection.execute(update_vendor, [{"b_id": vendor_id, **values} for vendor_id, values, _, _ in batch])
+
+        # hours are replaced wholesale: delete first, positions are unique
+        rehoured = [(vendor_id, hours) for vendor_id, _, hours, _ in batch if hours is not None]
+        if rehoured:
+            connection.execute(delete(hours_table).where(hours_table.c.vendor_id.in_([i for i, _ in rehoured])))
+            rows = [{"vendor_id": vendor_id, "position": position, "text": line}
+                    for vendor_id, hours in rehoured for position, line in enumerate(hours)]
+            if rows:
+                connection.execute(insert(hours_table), rows)
+        link_rows = [{"vendor_id": vendor_id, "kind": kind, "url": url}
+                     for vendor_id, _, _, links in batch for kind, url in links.items()]
+        if link_rows:
+            connection.execute(upsert_link, link_rows)
+
+
+def process_and_store(input_files, bind=None, batch_size=None):
+    """
+    Bulk-load vendor records into the database in a single transaction.
+
+    Records already loaded by an earlier run are found through
+    vendor_sources and updated in place (only if something changed);
+    the rest are inserted. Writes are Core executemany batches, and large
+    loads rebuild the search indexes once at the end instead of row by row.
+
+    Args:
+        input_files (list[str]): JSON files of vendor records.
+        bind: Engine to load into; the configured database by default.
+        batch_size (int): Rows per batch; ``config.LOAD_BATCH_SIZE`` by default.
+
+    Returns:
+        int: Number of vendors inserted or updated.
+    """
+    batch_size = batch_size or config.LOAD_BATCH_SIZE
+    started = time.perf_counter()
+    records = read_records(input_files)
+
+    with (bind or engine).begin() as connection:
+        # Take the write lock up front: resolving and diffing against
+        # stored rows is only valid if no other writer gets in between
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+        existing_ids = resolve_vendor_ids(connection, [key for key in map(source_key, records) if key])
+        current = load_current(connection, list(set(existing_ids.values())), batch_size)
+
+        creates, updates = [], []
+        for v in records:
+            key = source_key(v)
+            values = vendor_values(v)
+            hours = parse_hours(v.get("hours") or v.get("opening_hours"))
+            links = clean_links(v)
+            vendor_id = existing_ids.get(key)
+            if vendor_id is None:
+                creates.append((key, values, hours, links))
+                continue
+            stored = current[vendor_id]
+            changed_links = {kind: url for kind, url in links.items() if stored["links"].get(kind) != url}
+            new_hours = hours if hours != stored["hours"] else None
+            if new_hours is not None or changed_links or any(
+                    stored["row"][name] != value for name, value in values.items()):
+                updates.append((vendor_id, values, new_hours, changed_links))
+
+        defer = len(creates) + len(updates) >= config.LOAD_DEFER_INDEX_ROWS
+        with deferred_index_maintenance(connection, enabled=defer):
+            insert_vendors(connection, creates, batch_size)
+            update_vendors(connection, updates, batch_size)
+
+        # Invalidate web caches tagged with the previous version; a reload
+        # that changes nothing keeps them (and every ETag) valid
+        if creates or updates:
+            bump_data_version(connection)
+
+    elapsed = time.perf_counter() - started
+    unchanged = len(records) - len(creates) - len(updates)
+    print(f"Stored {len(records)} unique vendors in DB ({len(creates)} new, {len(updates)} updated, "
+          f"{unchanged} unchanged) in {elapsed:.2f}s ({len(records) / max(elapsed, 1e-9):.0f} rows/s).")
+    return len(creates) + len(updates)
+
+
+def build_snapshot(input_files):
+    """
+    Load ``input_files`` into a new database file and swap it in atomically.
+
+    The live database is copied (SQLite backup API), the load runs against
+    the copy, which is then ANALYZEd and checkpointed before the pointer
+    file is switched to it. The web app keeps serving the old file
+    throughout and picks up the new one on its next poll. Writes made to
+    the live database while the snapshot is being built are not carried
+    over.
+
+    Args:
+        input_files (list[str]): JSON files of vendor records.
+
+    Returns:
+        str: Path of the snapshot now in use.
+    """
+    live_path = make_url(config.DATABASE_URI).database
+    snapshot = new_snapshot_path(live_path)
+    current = resolve_database(live_path)
+    if os.path.exists(current):
+        copy_database(current, snapshot)
+
+    snapshot_engine = create_tuned_engine(f"sqlite:///{os.path.abspath(snapshot)}")
+    prepare_database(snapshot_engine)
+    with snapshot_engine.connect() as connection:
+        copied_version = get_data_version(connection).version
+    written = process_and_store(input_files, snapshot_engine)
+
+    # Caches must never see the version go backwards across the swap. An
+    # unchanged copy of an unchanged live database keeps its version.
+    # Pooled connections may still be open on a file an earlier swap
+    # replaced: drop them so the read below follows the pointer.
+    engine.dispose()
+    with engine.connect() as live:
+        live_version = get_data_version(live).version
+    with snapshot_engine.begin() as connection:
+        # a load that wrote rows has already bumped the copied version
+        if (written or live_version != copied_version) and get_data_version(connection).version <= live_version:
+            bump_data_version(connection, past=live_version)
+    snapshot_engine.dispose()
+
+    finalize_snapshot(snapshot)
+    activate_snapshot(live_path, snapshot)
+    engine.dispose()  # later direct loads in this process write to the new file
+    print(f"Snapshot {snapshot} is now live.")
+    return snapshot
+
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Load pipeline output into the vendors database.")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="build a new database file and swap it in instead of writing to the live one")
+    args = parser.parse_args()
+
     #base_dir = os.path.dirname(os.path.abspath(__file__))
     out_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "outputs")
     osm_enriched = os.path.join(out_dir, "osm_enriched.json")
     yelp_fsq_enriched = os.path.join(out_dir, "yelp_fsq_enriched.json")
-    process_and_store([osm_enriched, yelp_fsq_enriched])
+    if args.snapshot:
+        build_snapshot([osm_enriched, yelp_fsq_enriched])
+    else:
+        process_and_store([osm_enriched, yelp_fsq_enriched])
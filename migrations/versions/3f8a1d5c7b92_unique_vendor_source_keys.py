@@ -0,0 +1,30 @@
+"""Unique (source, source_id) provenance keys on vendor_sources
+
+Revision ID: 3f8a1d5c7b92
+Revises: 9e2b7c4d1a86
+Create Date: 2026-10-17 20:11:52.640117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a1d5c7b92'
+down_revision = '9e2b7c4d1a86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keys are matched lowercased ("OSM" -> "osm"); keep the oldest row of
+    # any key that earlier (non-idempotent) loads recorded more than once
+    op.execute("UPDATE vendor_sources SET source = lower(trim(source))")
+    op.execute(
+        "DELETE FROM vendor_sources WHERE source_id IS NOT NULL AND id NOT IN ("
+        "SELECT min(id) FROM vendor_sources WHERE source_id IS NOT NULL GROUP BY source, source_id)"
+    )
+    op.create_index('ix_vendor_sources_source_source_id', 'vendor_sources', ['source', 'source_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_vendor_sources_source_source_id', table_name='vendor_sources')
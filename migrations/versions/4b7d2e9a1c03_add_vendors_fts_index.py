@@ -0,0 +1,28 @@
+"""Add FTS5 full-text index over vendors
+
+Revision ID: 4b7d2e9a1c03
+Revises: 831355cec360
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+from alembic import op
+
+from app.search_index import DROP_FTS, install_search_index, rebuild_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7d2e9a1c03'
+down_revision = '831355cec360'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    install_search_index(connection)
+    rebuild_search_index(connection)
+
+
+def downgrade():
+    for statement in DROP_FTS:
+        op.execute(statement)
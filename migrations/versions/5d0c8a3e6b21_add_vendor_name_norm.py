@@ -0,0 +1,51 @@
+"""Add normalized name column to vendors
+
+Revision ID: 5d0c8a3e6b21
+Revises: b81e4d6f2a97
+Create Date: 2026-10-17 14:08:33.612950
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.normalize import normalize_text
+from app.search_index import install_search_index
+from app.geo import install_geo_index
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c8a3e6b21'
+down_revision = 'b81e4d6f2a97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_norm', sa.String(length=100), nullable=True))
+
+    # Backfill with the same normalizer the pipeline uses
+    connection = op.get_bind()
+    rows = connection.execute(sa.text("SELECT id, name FROM vendors")).all()
+    if rows:
+        connection.execute(
+            sa.text("UPDATE vendors SET name_norm = :name_norm WHERE id = :id"),
+            [{"id": row.id, "name_norm": normalize_text(row.name)} for row in rows],
+        )
+
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        batch_op.create_index('ix_vendors_name_norm', ['name_norm'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        batch_op.drop_index('ix_vendors_name_norm')
+        batch_op.drop_column('name_norm')
+
+    # dropping a column rebuilds the table, which drops its triggers and
+    # reflects the COLLATE NOCASE index as a plain one
+    connection = op.get_bind()
+    install_search_index(connection)
+    install_geo_index(connection)
+    op.execute("DROP INDEX IF EXISTS ix_vendors_city_nocase")
+    op.execute("CREATE INDEX ix_vendors_city_nocase ON vendors (city COLLATE NOCASE)")
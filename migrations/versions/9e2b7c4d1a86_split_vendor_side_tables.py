@@ -0,0 +1,120 @@
+"""Move socials, hours and sources out of vendors into side tables
+
+Revision ID: 9e2b7c4d1a86
+Revises: c4f9a7e1b350
+Create Date: 2026-10-17 19:05:37.512904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.geo import install_geo_index
+from app.normalize import EMPTY_VALUES, parse_hours
+from app.search_index import install_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2b7c4d1a86'
+down_revision = 'c4f9a7e1b350'
+branch_labels = None
+depends_on = None
+
+SOCIAL_COLUMNS = ('instagram', 'facebook', 'twitter', 'linkedin', 'youtube', 'tiktok', 'pinterest')
+
+
+def _restore_search_objects(connection):
+    # rebuilding vendors drops its triggers and reflects the COLLATE NOCASE
+    # index as a plain one
+    install_search_index(connection)
+    install_geo_index(connection)
+    op.execute("DROP INDEX IF EXISTS ix_vendors_city_nocase")
+    op.execute("CREATE INDEX ix_vendors_city_nocase ON vendors (city COLLATE NOCASE)")
+
+
+def upgrade():
+    op.create_table('vendor_links',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('url', sa.String(length=200), nullable=False),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendors.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('vendor_id', 'kind', name='uq_vendor_links_vendor_id_kind')
+    )
+    op.create_table('vendor_hours',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('text', sa.String(length=100), nullable=False),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendors.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('vendor_id', 'position', name='uq_vendor_hours_vendor_id_position')
+    )
+    op.create_table('vendor_sources',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(length=30), nullable=False),
+    sa.Column('source_id', sa.String(length=100), nullable=True),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendors.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('vendor_sources', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_vendor_sources_vendor_id'), ['vendor_id'], unique=False)
+
+    # Move the data: one link row per non-placeholder social URL, one
+    # hours row per line of the stringified hours list
+    connection = op.get_bind()
+    placeholders = ", ".join(f"'{value}'" for value in sorted(EMPTY_VALUES))
+    for kind in SOCIAL_COLUMNS:
+        connection.execute(sa.text(
+            f"INSERT INTO vendor_links (vendor_id, kind, url) "
+            f"SELECT id, '{kind}', trim({kind}) FROM vendors "
+            f"WHERE {kind} IS NOT NULL AND lower(trim({kind})) NOT IN ({placeholders})"
+        ))
+    rows = connection.execute(sa.text("SELECT id, hours FROM vendors WHERE hours IS NOT NULL")).all()
+    hours = [
+        {"vendor_id": row.id, "position": i, "text": line}
+        for row in rows
+        for i, line in enumerate(parse_hours(row.hours))
+    ]
+    if hours:
+        connection.execute(
+            sa.text("INSERT INTO vendor_hours (vendor_id, position, text) VALUES (:vendor_id, :position, :text)"),
+            hours,
+        )
+
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        for column in SOCIAL_COLUMNS + ('hours',):
+            batch_op.drop_column(column)
+    _restore_search_objects(connection)
+
+
+def downgrade():
+    for column in ('hours',) + SOCIAL_COLUMNS:
+        length = 100 if column == 'hours' else 200
+        op.add_column('vendors', sa.Column(column, sa.String(length=length), nullable=True))
+
+    connection = op.get_bind()
+    for kind in SOCIAL_COLUMNS:
+        connection.execute(sa.text(
+            f"UPDATE vendors SET {kind} = (SELECT url FROM vendor_links "
+            f"WHERE vendor_links.vendor_id = vendors.id AND kind = '{kind}')"
+        ))
+    # back to the stringified list the Google scripts wrote
+    hours = {}
+    for vendor_id, text in connection.execute(
+        sa.text("SELECT vendor_id, text FROM vendor_hours ORDER BY vendor_id, position")
+    ):
+        hours.setdefault(vendor_id, []).append(text)
+    if hours:
+        connection.execute(
+            sa.text("UPDATE vendors SET hours = :hours WHERE id = :id"),
+            [{"id": vendor_id, "hours": str(lines)} for vendor_id, lines in hours.items()],
+        )
+
+    with op.batch_alter_table('vendor_sources', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_vendor_sources_vendor_id'))
+
+    op.drop_table('vendor_sources')
+    op.drop_table('vendor_hours')
+    op.drop_table('vendor_links')
@@ -0,0 +1,43 @@
+"""Add lat/lon to vendors with an R*Tree spatial index
+
+Revision ID: b81e4d6f2a97
+Revises: 7c3f0b2d9e15
+Create Date: 2026-10-17 12:41:52.270113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.geo import DROP_RTREE, install_geo_index, rebuild_geo_index
+from app.search_index import install_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81e4d6f2a97'
+down_revision = '7c3f0b2d9e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('lat', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('lon', sa.Float(), nullable=True))
+        batch_op.create_index('ix_vendors_city_nocase', [sa.text('city COLLATE NOCASE')], unique=False)
+
+    connection = op.get_bind()
+    install_geo_index(connection)
+    rebuild_geo_index(connection)
+
+
+def downgrade():
+    for statement in DROP_RTREE:
+        op.execute(statement)
+
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        batch_op.drop_index('ix_vendors_city_nocase')
+        batch_op.drop_column('lon')
+        batch_op.drop_column('lat')
+
+    # dropping a column rebuilds the table, which drops its triggers
+    install_search_index(op.get_bind())
@@ -0,0 +1,45 @@
+"""Add row_version and updated_at to vendors
+
+Revision ID: c4f9a7e1b350
+Revises: 5d0c8a3e6b21
+Create Date: 2026-10-17 15:20:14.087356
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.search_index import install_search_index
+from app.geo import install_geo_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f9a7e1b350'
+down_revision = '5d0c8a3e6b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # plain ALTER TABLE ADD COLUMN: a batch rebuild would drop the FTS and
+    # R*Tree triggers and the COLLATE NOCASE expression index
+    op.add_column('vendors', sa.Column('row_version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+    op.add_column('vendors', sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute("UPDATE vendors SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL")
+
+    op.create_index('ix_vendors_id_row_version', 'vendors', ['id', 'row_version', 'updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        batch_op.drop_index('ix_vendors_id_row_version')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('row_version')
+
+    # dropping a column rebuilds the table, which drops its triggers and
+    # reflects the COLLATE NOCASE index as a plain one
+    connection = op.get_bind()
+    install_search_index(connection)
+    install_geo_index(connection)
+    op.execute("DROP INDEX IF EXISTS ix_vendors_city_nocase")
+    op.execute("CREATE INDEX ix_vendors_city_nocase ON vendors (city COLLATE NOCASE)")
@@ -0,0 +1,51 @@
+"""Add country_code column and composite search indexes to vendors
+
+Revision ID: e2a91f5c7d48
+Revises: 4b7d2e9a1c03
+Create Date: 2026-10-17 10:03:27.551930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.countries import country_code
+from app.search_index import install_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a91f5c7d48'
+down_revision = '4b7d2e9a1c03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('country_code', sa.String(length=2), nullable=True))
+
+    # Backfill: one UPDATE per distinct country value
+    connection = op.get_bind()
+    countries = connection.execute(
+        sa.text("SELECT DISTINCT country FROM vendors WHERE country IS NOT NULL")
+    ).scalars().all()
+    for country in countries:
+        code = country_code(country)
+        if code:
+            connection.execute(
+                sa.text("UPDATE vendors SET country_code = :code WHERE country = :country"),
+                {"code": code, "country": country},
+            )
+
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        batch_op.create_index('ix_vendors_country_code_service_type', ['country_code', 'service_type'], unique=False)
+        batch_op.create_index('ix_vendors_country_code_city', ['country_code', 'city'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('vendors', schema=None) as batch_op:
+        batch_op.drop_index('ix_vendors_country_code_city')
+        batch_op.drop_index('ix_vendors_country_code_service_type')
+        batch_op.drop_column('country_code')
+
+    # dropping a column rebuilds the table, which drops its triggers
+    install_search_index(op.get_bind())
@@ -11,13 +11,15 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 #from app import db
 from app.app import db, create_app
 from app.models import Vendor
+from app.export import csv_chunks, fetch_batches
+from app.snapshot import resolve_database
 import requests
 import sqlite3
  
 def connect_to_db():
     """Connect to the SQLite database."""
     db_path = os.path.join(os.path.dirname(__file__), '..', 'app', 'instance', 'vendors.db')
-    connection = sqlite3.connect(db_path)
+    connection = sqlite3.connect(resolve_database(db_path))  # follow snapshot swaps
 
     print("Connection established.")
     return connection
@@ -73,18 +75,27 @@ def delete_duplicates(connection, duplicates):
 
     return  
 
-def save_db_to_csv(connection):
-    """Save the vendors table to a CSV file."""
+def save_db_to_csv(connection, path=None):
+    """Save the vendors table to a CSV file.
+
+    Streams rows in batches with proper CSV quoting (see app/export.py, or
+    use ``python -m app.export --format csv`` / GET /vendors/export).
+
+    Args:
+        connection: sqlite3 connection to the vendors database.
+        path: Output file; defaults to vendors.csv next to this script.
+    """
+    path = path or os.path.join(os.path.dirname(__file__), 'vendors.csv')
 
     cursor = connection.cursor()
-    query = "SELECT * FROM vendors"
-    cursor.execute(query)
+    cursor.execute("SELECT * FROM vendors")
+    header = [column[0] for column in cursor.description]
 
-    with open('vendors.csv', 'w') as f:
-        for row in cursor.fetchall():
-            f.write(','.join(map(str, row)) + '\n')
+    with open(path, 'w', newline='') as f:
+        for chunk in csv_chunks(header, fetch_batches(cursor)):
+            f.write(chunk)
 
-    print("Database saved to vendors.csv.")
+    print(f"Database saved to {path}.")
     return
 
 def close_connection(connection):
@@ -0,0 +1,21 @@
+import pytest
+
+from app.app import create_app
+from app.models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(str(tmp_path / "vendors.db"))
+    app.config["TESTING"] = True
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,24 @@
+from app.models import Vendor, db
+
+
+def vendor(name, **fields):
+    return {"name": name, "service_type": "venue", "country": "Italy", **fields}
+
+
+def test_non_object_item_is_reported_invalid(app, client):
+    response = client.post("/vendors/bulk", json=[vendor("Villa Uno"), 5, vendor("Villa Due")])
+
+    assert response.status_code != 500
+    statuses = response.get_json()["items"]
+    assert [item["status"] for item in statuses] == ["created", "invalid", "created"]
+    assert statuses[1]["errors"] == {"item": "Expected a JSON object"}
+    with app.app_context():
+        assert db.session.query(Vendor).count() == 2
+
+
+def test_repeated_id_is_reported_invalid(app, client):
+    response = client.post("/vendors/bulk", json=[vendor("Villa Uno", id=7), vendor("Villa Due", id=7)])
+
+    statuses = response.get_json()["items"]
+    assert [item["status"] for item in statuses] == ["created", "invalid"]
+    assert "id" in statuses[1]["errors"]
@@ -0,0 +1,29 @@
+import pytest
+
+from app.models import Vendor, db
+
+
+@pytest.fixture
+def vendor_id(app):
+    with app.app_context():
+        db.session.add_all(
+            Vendor(name=f"Villa {i}", service_type="venue", country="Italy", city="Palermo",
+                   website=f"http://villa{i}.example", address="Via Roma, Palermo " * 40)
+            for i in range(30)
+        )
+        db.session.commit()
+        return db.session.query(Vendor.id).first()[0]
+
+
+@pytest.mark.parametrize("url", ["/search?country=IT", "/vendor/{id}"])
+def test_304_repeats_the_compressed_responses_validator(client, vendor_id, url):
+    url = url.format(id=vendor_id)
+    full = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert full.status_code == 200
+    assert full.headers["Content-Encoding"] == "gzip"
+
+    cached = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": full.headers["ETag"]})
+
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == full.headers["ETag"]
+    assert "Accept-Encoding" in cached.headers["Vary"]
@@ -0,0 +1,54 @@
+import pytest
+
+from app.models import Vendor, db
+from app.pagination import encode_cursor
+
+
+@pytest.fixture
+def vendors(app):
+    with app.app_context():
+        db.session.add_all(
+            Vendor(name=f"Villa {i}", service_type="venue", country="Italy", city="Palermo",
+                   website=f"http://villa{i}.example")
+            for i in range(5)
+        )
+        db.session.commit()
+
+
+@pytest.mark.parametrize("key", [([1], {}), (None, None), ("x", 1), (0.0, "1e999"), (float("nan"), 1)])
+def test_tampered_cursor_falls_back_to_first_page(client, vendors, key):
+    cursor = encode_cursor(*key)
+
+    api = client.get(f"/vendors/search?country=IT&cursor={cursor}")
+    assert api.status_code == 200
+    assert [row["name"] for row in api.get_json()["results"]][:1] == ["Villa 0"]
+
+    page = client.get(f"/search?country=IT&cursor={cursor}")
+    assert page.status_code == 200
+    assert b"Villa 0" in page.data
+
+
+def test_plain_form_submission_is_not_redirected(client, vendors):
+    # without JavaScript the form sends every field, including the radius select
+    response = client.get("/search?country=IT&service=venue&search=&near=&radius_km=25")
+
+    assert response.status_code == 200
+    assert b"Villa 0" in response.data
+
+
+@pytest.mark.parametrize("query, location", [
+    ("city=Palermo", "/search?city=palermo"),
+    ("country=Italy&near=Palermo&radius_km=10", "/search?country=IT&near=palermo&radius_km=10"),
+])
+def test_equivalent_searches_redirect_to_the_canonical_url(client, query, location):
+    response = client.get(f"/search?{query}")
+
+    assert response.status_code == 301
+    assert response.headers["Location"] == location
+
+
+def test_non_ascii_values_keep_their_case(client):
+    # SQLite's NOCASE folds ASCII only, so "İstanbul" must not become "i̇stanbul"
+    response = client.get("/search?city=%C4%B0stanbul")
+
+    assert response.status_code == 200
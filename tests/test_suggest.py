@@ -0,0 +1,69 @@
+from sqlalchemy import delete, update
+
+from app.models import Vendor, db
+from app.suggest import PrefixIndex, Suggester
+
+
+class FixedVersion:
+    version = 0
+
+    def current(self):
+        return self.version
+
+
+def add_vendors(*pairs):
+    db.session.add_all(Vendor(name=name, city=city, service_type="venue", country="Italy") for name, city in pairs)
+    db.session.commit()
+
+
+def test_update_matches_a_full_rebuild(app):
+    with app.app_context():
+        add_vendors(("Villa Mondello", "Palermo"), ("Foto Monreale", "Palermo"), ("Sala Etna", "Catania"))
+    suggester = Suggester(app, FixedVersion())
+    suggester.build(0)
+
+    with app.app_context():
+        db.session.execute(update(Vendor).where(Vendor.name == "Villa Mondello").values(name="Villa Igiea"))
+        db.session.execute(delete(Vendor).where(Vendor.city == "Catania"))
+        add_vendors(("Fiori Ortigia", "Siracusa"))
+    suggester.update(1)
+
+    assert suggester.index.search("mon") == [("Foto Monreale", "vendor")]
+    assert suggester.index.search("igiea") == [("Villa Igiea", "vendor")]
+    assert suggester.index.search("cat") == []
+    assert suggester.index.search("sir") == [("Siracusa", "city")]
+
+    rebuilt = Suggester(app, FixedVersion())
+    rebuilt.build(1)
+    assert (suggester.index.keys, suggester.index.entries) == (rebuilt.index.keys, rebuilt.index.entries)
+    assert suggester.version == 1
+
+
+def test_shared_label_stays_until_its_last_vendor_is_gone(app):
+    with app.app_context():
+        add_vendors(("Villa Uno", "Palermo"), ("Villa Due", "Palermo"))
+    suggester = Suggester(app, FixedVersion())
+    suggester.build(0)
+
+    with app.app_context():
+        db.session.execute(delete(Vendor).where(Vendor.name == "Villa Uno"))
+        db.session.commit()
+    suggester.update(1)
+    assert ("Palermo", "city") in suggester.index.search("pal")
+
+    with app.app_context():
+        db.session.execute(delete(Vendor).where(Vendor.name == "Villa Due"))
+        db.session.commit()
+    suggester.update(2)
+    assert suggester.index.search("pal") == []
+    assert len(suggester.index) == 0
+
+
+def test_apply_keeps_build_order():
+    index = PrefixIndex.build([("Villa Rosa", "vendor"), ("Roma", "city")])
+
+    updated = index.apply(added=[("Rosa Bianca", "vendor")], removed=[("Roma", "city")])
+
+    expected = PrefixIndex.build([("Villa Rosa", "vendor"), ("Rosa Bianca", "vendor")])
+    assert (updated.keys, updated.entries) == (expected.keys, expected.entries)
+    assert ("Roma", "city") in index.search("rom")  # the original is left untouched